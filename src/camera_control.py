@@ -1,10 +1,28 @@
-from picamera2 import Picamera2
+import itertools
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from config import (
+    FRAME_WIDTH,
+    FRAME_HEIGHT,
+    LORES_FRAME_WIDTH,
+    LORES_FRAME_HEIGHT,
+    CAMERA_CAPTURE_TIMEOUT
+)
+
+def initialize_camera(lores=False):
+    from picamera2 import Picamera2 # Only available on the Raspberry Pi
 
-def initialize_camera():
     picam2 = Picamera2()
-    picam2_config = picam2.create_video_configuration(
-        raw={"size": (1640, 1232)}, main={"size": (640, 480), "format": "XRGB8888"}
-    )
+    streams = {"raw": {"size": (1640, 1232)}, "main": {"size": (FRAME_WIDTH, FRAME_HEIGHT), "format": "XRGB8888"}}
+    if lores:
+        # Small YUV stream whose luma plane is used for lane detection
+        streams["lores"] = {"size": (LORES_FRAME_WIDTH, LORES_FRAME_HEIGHT), "format": "YUV420"}
+
+    picam2_config = picam2.create_video_configuration(**streams)
     picam2.align_configuration(picam2_config)
     picam2.configure(picam2_config)
     picam2.start()
@@ -12,3 +30,124 @@ def initialize_camera():
 
 def capture_image(picam2):
     return picam2.capture_array()
+
+# Stand-in for Picamera2 that serves frames from a sequence, iterable or callable, for testing off the robot
+class FakeCamera:
+    def __init__(self, frames, frame_rate=None, loop=True):
+        if callable(frames):
+            self.frames = iter(frames, None)
+        elif loop:
+            self.frames = itertools.cycle(frames)
+        else:
+            self.frames = iter(frames)
+        self.frame_period = 1 / frame_rate if frame_rate else 0
+        self.next_frame_time = time.perf_counter()
+
+    # Returns the next frame (resized to the main stream size) and, if requested, its lores YUV420 version
+    def capture_arrays(self, names=("main",)):
+        if self.frame_period:
+            # Pace frames like a sensor running at a fixed frame rate
+            self.next_frame_time = max(self.next_frame_time + self.frame_period, time.perf_counter())
+            time.sleep(max(0.0, self.next_frame_time - time.perf_counter()))
+
+        frame = next(self.frames, None)
+        if frame is None:
+            raise EOFError("Fake camera ran out of frames")
+        if frame.shape[:2] != (FRAME_HEIGHT, FRAME_WIDTH):
+            frame = cv2.resize(frame, (FRAME_WIDTH, FRAME_HEIGHT))
+        if frame.ndim == 2:
+            frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGRA)
+        elif frame.shape[2] == 3:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2BGRA) # Match the XRGB8888 main stream
+
+        arrays = []
+        for name in names:
+            if name == "main":
+                arrays.append(frame)
+            else:
+                lores_frame = cv2.resize(frame[:, :, :3], (LORES_FRAME_WIDTH, LORES_FRAME_HEIGHT))
+                arrays.append(cv2.cvtColor(lores_frame, cv2.COLOR_BGR2YUV_I420))
+        return arrays, {}
+
+    def capture_array(self, name="main"):
+        arrays, _ = self.capture_arrays([name])
+        return arrays[0]
+
+    def stop(self):
+        pass
+
+# Captures frames on a background thread and keeps only the newest one, so readers never wait on the sensor
+class CameraStream:
+    """
+    The capture thread writes each frame into a back buffer and swaps it with the front buffer,
+    so frames are never queued and a reader always gets the latest one.
+    With the lores stream enabled, each frame also carries the luma plane of the matching lores frame.
+    """
+
+    def __init__(self, camera, lores=False):
+        self.camera = camera
+        self.stream_names = ["main", "lores"] if lores else ["main"]
+        self.condition = threading.Condition()
+        self.front = None
+        self.back = None
+        self.read_buffers = None
+        self.frame_id = -1
+        self.timestamp = None
+        self.error = None
+        self.is_running = False
+        self.thread = None
+
+    def start(self):
+        self.is_running = True
+        self.thread = threading.Thread(target=self.run, name="camera-capture", daemon=True)
+        self.thread.start()
+        return self
+
+    # Copies images into a buffer set, allocating it on first use
+    def store(self, buffers, images):
+        if buffers is None:
+            return [image.copy() for image in images]
+
+        for buffer, image in zip(buffers, images):
+            np.copyto(buffer, image)
+        return buffers
+
+    def run(self):
+        try:
+            while self.is_running:
+                arrays, _ = self.camera.capture_arrays(self.stream_names)
+                timestamp = time.perf_counter()
+                images = [arrays[0]] + [array[:LORES_FRAME_HEIGHT] for array in arrays[1:]] # Keep only the lores luma plane
+                self.back = self.store(self.back, images)
+
+                with self.condition:
+                    self.front, self.back = self.back, self.front
+                    self.frame_id += 1
+                    self.timestamp = timestamp
+                    self.condition.notify_all()
+        except Exception as e:
+            with self.condition:
+                self.error = e
+                self.condition.notify_all()
+
+    # Returns (frame_id, timestamp, frame, lores luma or None) for the newest frame newer than last_frame_id.
+    # The arrays are reused by the next call.
+    def read(self, last_frame_id=-1, timeout=CAMERA_CAPTURE_TIMEOUT):
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.frame_id > last_frame_id or self.error is not None, timeout):
+                raise TimeoutError(f"No camera frame received within {timeout} s")
+            if self.frame_id <= last_frame_id:
+                raise RuntimeError("Camera capture stopped") from self.error
+
+            self.read_buffers = self.store(self.read_buffers, self.front)
+            frame_id, timestamp = self.frame_id, self.timestamp
+
+        lores_luma = self.read_buffers[1] if len(self.read_buffers) > 1 else None
+        return frame_id, timestamp, self.read_buffers[0], lores_luma
+
+    def stop(self):
+        self.is_running = False
+        if self.thread is not None:
+            self.thread.join(CAMERA_CAPTURE_TIMEOUT)
+            self.thread = None
+        self.camera.stop()
@@ -1,8 +1,19 @@
+import os
+
 import numpy as np
 
+# Project root, so paths do not depend on the working directory
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
 # Debugging mode
 DEBUG = False
 
+# Debug view parameters (used when DEBUG is on)
+DEBUG_VIEW_MODE = "auto" # "display" shows the debug images in windows, "video" or "images" records them; "auto" displays if a screen is available, else records video
+DEBUG_VIEW_QUEUE_SIZE = 16 # Debug images waiting for the viewer; the oldest are dropped when it falls behind
+DEBUG_VIEW_OUTPUT_DIR = os.path.join(PROJECT_DIR, "debug") # Where recorded debug images and videos are written
+DEBUG_VIEW_VIDEO_FPS = 10
+
 # Sliding window parameters
 SLIDING_WINDOW_HALF_WIDTH = 60
 SLIDING_WINDOW_HEIGHT = 50
@@ -10,9 +21,22 @@ SLIDING_WINDOW_HEIGHT = 50
 # Frame sizes
 FRAME_WIDTH = 640
 FRAME_HEIGHT = 480
+FRAME_CHANNELS = 4 # XRGB8888 camera frames
+LORES_FRAME_WIDTH = 320
+LORES_FRAME_HEIGHT = 240
+
+# Camera parameters
+CAMERA_LORES_STREAM = False # Run lane detection on the luma plane of the camera's small lores stream
+CAMERA_CAPTURE_TIMEOUT = 2.0 # Seconds to wait for a new camera frame
 WARPED_FRAME_WIDTH = 480
 WARPED_FRAME_HEIGHT = 720
 
+# Perception engine parameters
+PERCEPTION_RING_SLOTS = 2 # Number of frames that can be in flight in the shared-memory ring
+PERCEPTION_RESULT_TIMEOUT = 10.0 # Seconds to wait for a worker result before giving up
+PERCEPTION_STARTUP_TIMEOUT = 60.0 # Seconds to wait for the workers to load and warm up their models
+PERCEPTION_WARMUP_FRAMES = 2 # Dummy frames each worker processes before reporting ready
+
 # Perspective transformation points
 ORIGINAL_PERSPECTIVE_POINTS = np.float32([
     (110, 250), # top-left
@@ -54,6 +78,136 @@ LANE_LINES = [
     }
 ]
 
+# Threshold lane line colors before warping, so only a single-channel mask is warped instead of the color frame
+LANE_MASK_BEFORE_WARP = False
+
+# Scale of the bird's-eye view that lanes are detected in (e.g. 0.5 or 0.25). Lane parameters are scaled with it
+# and results are reported at full scale.
+LANE_PROCESSING_SCALE = 1.0
+
+# Lane tracking parameters
+LANE_TRACKING = True # Search around the previous center line fit instead of searching every frame from scratch
+LANE_TRACKING_SEARCH_MARGIN = 40 # Half-width of the band searched around each expected lane line
+LANE_TRACKING_MIN_COVERAGE = 0.3 # Minimum fraction of warped frame rows with line pixels in the band to keep tracking
+LANE_TRACKING_SMOOTHING = 0.5 # Weight of the newest fit in the exponential filter (1 disables smoothing)
+LANE_TRACKING_MAX_MISSED_FRAMES = 3 # Frames the last fit is reused for before the lanes are reported as lost
+LANE_TRACKING_ROW_STEP = 8 # Only every n-th warped frame row is searched while tracking
+
+# Lane fit parameters
+LANE_FIT_OUTLIER_THRESHOLD = 30 # Center line points farther than this (in full-scale warped frame pixels) from the fit are outliers
+LANE_FIT_MAX_REFITS = 2 # Times the fit is repeated without the outliers of the previous fit
+
+# Object detection parameters
+OBJECT_DETECTION_BACKEND = "ncnn" # "ncnn" runs the exported model directly, "ultralytics" runs it through the ultralytics package
+OBJECT_DETECTION_MODEL_PATH = os.path.join(PROJECT_DIR, "models", "yolo11n_ncnn_model")
+OBJECT_DETECTION_CONF_THRESHOLD = 0.25 # Same defaults as ultralytics
+OBJECT_DETECTION_IOU_THRESHOLD = 0.7
+OBJECT_DETECTION_MAX_DETECTIONS = 300
+NCNN_INPUT_SIZE = 640 # Must match the exported model's imgsz
+NCNN_NUM_THREADS = 4
+NCNN_LIGHTMODE = True # Free intermediate blobs during inference to reduce memory use
+
+# Object detection model variants. Each is an exported model run at the input size it was exported with (e.g.
+# "yolo export model=yolo11n.pt format=ncnn imgsz=480") and a precision ("fp32", "fp16", or "int8" for models quantized
+# with ncnn2int8), optionally on a crop of the road region ("roi", as [xmin, ymin, xmax, ymax] in frame pixels).
+# Variants whose model files are missing or were exported at another input size are skipped.
+OBJECT_DETECTION_MODEL_VARIANTS = [
+    {'name': 'yolo11n-640', 'path': OBJECT_DETECTION_MODEL_PATH, 'input_size': 640, 'precision': 'fp32', 'roi': None},
+    {'name': 'yolo11n-640-fp16', 'path': OBJECT_DETECTION_MODEL_PATH, 'input_size': 640, 'precision': 'fp16', 'roi': None},
+    {'name': 'yolo11n-480-fp16', 'path': os.path.join(PROJECT_DIR, "models", "yolo11n_480_ncnn_model"), 'input_size': 480, 'precision': 'fp16', 'roi': None},
+    {'name': 'yolo11n-320-fp16', 'path': os.path.join(PROJECT_DIR, "models", "yolo11n_320_ncnn_model"), 'input_size': 320, 'precision': 'fp16', 'roi': None},
+    {'name': 'yolo11n-road-480-fp16', 'path': os.path.join(PROJECT_DIR, "models", "yolo11n_480_ncnn_model"), 'input_size': 480, 'precision': 'fp16', 'roi': [0, 120, 640, 480]},
+    {'name': 'yolo11n-road-320-fp16', 'path': os.path.join(PROJECT_DIR, "models", "yolo11n_320_ncnn_model"), 'input_size': 320, 'precision': 'fp16', 'roi': [0, 120, 640, 480]},
+    {'name': 'yolo11n-640-int8', 'path': os.path.join(PROJECT_DIR, "models", "yolo11n_int8_ncnn_model"), 'input_size': 640, 'precision': 'int8', 'roi': None},
+    {'name': 'yolo11n-road-320-int8', 'path': os.path.join(PROJECT_DIR, "models", "yolo11n_320_int8_ncnn_model"), 'input_size': 320, 'precision': 'int8', 'roi': [0, 120, 640, 480]}
+]
+OBJECT_DETECTION_REFERENCE_VARIANT = 'yolo11n-640' # Variant the others are compared against when profiling
+OBJECT_DETECTION_MODEL_VARIANT = 'auto' # Variant to run, or "auto" for the fastest profiled variant within the limits below
+OBJECT_DETECTION_MIN_AGREEMENT = 0.9 # Least detection agreement (F1 score) with the reference variant for auto selection
+OBJECT_DETECTION_LATENCY_BUDGET = 0.1 # Seconds of p90 detector latency allowed for auto selection
+OBJECT_DETECTION_MIN_REFERENCE_BOXES = 20 # Least boxes the reference variant must detect in a recording for its profile to be saved
+OBJECT_DETECTION_PROFILE_PATH = os.path.join(PROJECT_DIR, "models", "variant_profile.json") # Written by src/profile_models.py
+
+# CPU plans: the cores each process is pinned to and the threads its libraries may use. Roles are "main" (camera,
+# perception thread and control loop), "lane" and "object" (the perception workers). Settings left out keep the
+# library defaults, and cores the machine does not have are ignored. The plans are laid out for a 4-core Pi.
+CPU_PLANS = {
+    'default': {}, # No pinning, library default thread counts
+    'split': {
+        'main': {'cores': [0], 'opencv_threads': 1},
+        'lane': {'cores': [1], 'opencv_threads': 1},
+        'object': {'cores': [2, 3], 'opencv_threads': 1, 'ncnn_threads': 2}
+    },
+    'object_heavy': {
+        'main': {'cores': [0], 'opencv_threads': 1},
+        'lane': {'cores': [0], 'opencv_threads': 1},
+        'object': {'cores': [1, 2, 3], 'opencv_threads': 1, 'ncnn_threads': 3}
+    }
+}
+CPU_PLAN = 'split'
+
+# Object tracking parameters
+OBJECT_DETECTION_INTERVAL = 3 # Run the object detector every n-th frame and track boxes in between (1 runs it every frame)
+OBJECT_TRACKING_IOU_THRESHOLD = 0.3 # Minimum IoU for a detection to continue a track
+OBJECT_TRACKING_VELOCITY_SMOOTHING = 0.5 # Fraction of the prediction error applied to a track's velocity
+OBJECT_TRACKING_CONFIDENCE_DECAY = 0.9 # Confidence multiplier for every frame a track is predicted without a detection
+OBJECT_TRACKING_NEW_TRACK_CONFIDENCE = 0.6 # Confidence of a track whose velocity is not yet known
+OBJECT_TRACKING_MIN_CONFIDENCE = 0.5 # Run the detector early when any track falls below this confidence
+
+# Load governor parameters
+LOAD_GOVERNOR_ENABLED = True # Shed perception quality when frames take longer than the budget, and restore it when they are fast again
+PERCEPTION_FRAME_BUDGET = 0.15 # Seconds of perception latency per frame
+LOAD_GOVERNOR_SMOOTHING = 0.2 # Weight of the newest frame in the smoothed latency
+LOAD_GOVERNOR_DEGRADE_FRAMES = 5 # Consecutive frames over budget before stepping down a level
+LOAD_GOVERNOR_RECOVER_FRAMES = 30 # Consecutive frames with headroom before stepping back up a level
+LOAD_GOVERNOR_RECOVERY_HEADROOM = 0.7 # A frame has headroom when its smoothed latency is below this fraction of the budget
+
+# Degradation levels, from full quality to the cheapest settings. A smaller object detection variant needs its own
+# NCNN export (see OBJECT_DETECTION_MODEL_VARIANTS); if it is not exported, or is no smaller than the selected
+# variant, the level keeps running the selected one.
+DEGRADATION_LEVELS = [
+    {
+        'name': 'Full quality',
+        'skip_erode': False, # Skip eroding the lane lines mask
+        'object_detection_interval': OBJECT_DETECTION_INTERVAL, # Run the object detector every n-th frame
+        'object_detection_variant': None, # Smaller model variant to run instead of the selected one (None keeps it)
+        'lane_scale': LANE_PROCESSING_SCALE # Scale of the bird's-eye view that lanes are detected in
+    },
+    {
+        'name': 'No erode',
+        'skip_erode': True,
+        'object_detection_interval': OBJECT_DETECTION_INTERVAL,
+        'object_detection_variant': None,
+        'lane_scale': LANE_PROCESSING_SCALE
+    },
+    {
+        'name': 'Sparse detection',
+        'skip_erode': True,
+        'object_detection_interval': 2 * OBJECT_DETECTION_INTERVAL,
+        'object_detection_variant': None,
+        'lane_scale': LANE_PROCESSING_SCALE
+    },
+    {
+        'name': 'Small detector',
+        'skip_erode': True,
+        'object_detection_interval': 2 * OBJECT_DETECTION_INTERVAL,
+        'object_detection_variant': 'yolo11n-320-fp16',
+        'lane_scale': LANE_PROCESSING_SCALE
+    },
+    {
+        'name': 'Half lane resolution',
+        'skip_erode': True,
+        'object_detection_interval': 2 * OBJECT_DETECTION_INTERVAL,
+        'object_detection_variant': 'yolo11n-320-fp16',
+        'lane_scale': LANE_PROCESSING_SCALE / 2
+    }
+]
+
+# Telemetry parameters
+TELEMETRY_ENABLED = True # Record per-frame timings, perception results and control outputs in a ring buffer
+TELEMETRY_CAPACITY = 4096 # Number of most recent frames kept
+TELEMETRY_DUMP_PATH = os.path.join(PROJECT_DIR, "telemetry.npy") # Written at exit and whenever the process receives SIGUSR1
+
 # Motor control parameters
 MIN_MOTOR_SPEED = 0
 MAX_MOTOR_SPEED = 255
@@ -61,4 +215,11 @@ BASE_MOTOR_SPEED = 100
 
 # PID control parameters
 DESIRED_LANE_OFFSET = 0
-DESIRED_MIO_DISTANCE = WARPED_FRAME_HEIGHT
\ No newline at end of file
+DESIRED_MIO_DISTANCE = WARPED_FRAME_HEIGHT
+PID_REFERENCE_DT = 0.2 # Seconds per step the PID gains were tuned for (the old lockstep loop: inference plus a 0.1 s sleep)
+PID_INTEGRAL_LIMIT = 50 # Maximum magnitude of a PID integral term, in motor speed units
+PID_DERIVATIVE_TIME_CONSTANT = 0.05 # Seconds; low-pass filters the PID derivative term (0 disables filtering)
+
+# Control loop parameters
+CONTROL_LOOP_RATE = 50 # Motor control updates per second, independent of the perception rate
+PERCEPTION_MAX_AGE = 0.5 # Seconds since the capture of the last frame with lanes before the motors are stopped
\ No newline at end of file
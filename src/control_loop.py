@@ -0,0 +1,182 @@
+import threading
+import time
+
+from config import (
+    DEBUG,
+    CAMERA_CAPTURE_TIMEOUT,
+    BASE_MOTOR_SPEED,
+    DESIRED_LANE_OFFSET,
+    DESIRED_MIO_DISTANCE,
+    PID_INTEGRAL_LIMIT,
+    PID_DERIVATIVE_TIME_CONSTANT,
+    CONTROL_LOOP_RATE,
+    PERCEPTION_MAX_AGE,
+    LOAD_GOVERNOR_ENABLED
+)
+from drive_assist import get_lane_offset_and_mio_distance, set_degradation_level
+from load_governor import LoadGovernor
+from motor_control import set_motor_speeds, stop_motors
+from pid import PIDController
+from stage_timer import stage_timer
+
+def initialize_pid_controllers():
+    pid_lane = PIDController(kp=3.5, ki=0.0005, kd=1.2, integral_limit=PID_INTEGRAL_LIMIT, derivative_time_constant=PID_DERIVATIVE_TIME_CONSTANT)
+    pid_mio = PIDController(kp=4.0, ki=0.0002, kd=1.5, integral_limit=PID_INTEGRAL_LIMIT, derivative_time_constant=PID_DERIVATIVE_TIME_CONSTANT)
+    return pid_lane, pid_mio
+
+# Computes the left and right motor speeds from the lane offset and distance to MIO, dt seconds after the previous update
+def compute_motor_speeds(pid_lane, pid_mio, lane_offset, mio_distance, dt=None):
+    pid_lane_control = pid_lane.compute(DESIRED_LANE_OFFSET, lane_offset, dt)
+    pid_mio_control = pid_mio.compute(DESIRED_MIO_DISTANCE, mio_distance, dt)
+    motor_l_speed = BASE_MOTOR_SPEED - pid_lane_control - pid_mio_control
+    motor_r_speed = BASE_MOTOR_SPEED + pid_lane_control - pid_mio_control
+    return motor_l_speed, motor_r_speed
+
+# Lane offset and MIO distance of a camera frame, with the capture details needed for control and telemetry
+class PerceptionResult:
+    def __init__(self, frame_id, capture_time, degradation_level, lane_offset, mio_distance, stage_durations):
+        self.frame_id = frame_id
+        self.capture_time = capture_time
+        self.degradation_level = degradation_level
+        self.lane_offset = lane_offset
+        self.mio_distance = mio_distance
+        self.stage_durations = stage_durations
+
+# Runs perception on the newest camera frame, back to back, on a background thread and publishes the latest result.
+# The load governor, if enabled, adjusts the perception quality to each frame's latency.
+class PerceptionThread:
+    def __init__(self, camera_stream):
+        self.camera_stream = camera_stream
+        self.load_governor = LoadGovernor() if LOAD_GOVERNOR_ENABLED else None
+        self.latest_result = None # Replaced (never mutated) by the thread, so readers need no lock
+        self.error = None
+        self.is_running = False
+        self.thread = None
+
+    def start(self):
+        self.is_running = True
+        self.thread = threading.Thread(target=self.run, name="perception", daemon=True)
+        self.thread.start()
+        return self
+
+    def run(self):
+        frame_id = -1
+
+        try:
+            while self.is_running:
+                frame_id, capture_time, image, lores_luma = self.camera_stream.read(frame_id)
+                start_time = time.perf_counter()
+                lane_offset, mio_distance = get_lane_offset_and_mio_distance(image, lores_luma)
+
+                degradation_level = 0
+                if self.load_governor is not None:
+                    degradation_level = self.load_governor.level
+                    set_degradation_level(self.load_governor.update(time.perf_counter() - start_time))
+
+                stage_durations = None
+                if stage_timer.is_enabled:
+                    stage_durations = dict(stage_timer.frame_durations)
+                    stage_timer.reset_frame()
+
+                self.latest_result = PerceptionResult(frame_id, capture_time, degradation_level, lane_offset, mio_distance, stage_durations)
+        except Exception as e:
+            self.error = e
+
+    def stop(self):
+        self.is_running = False
+        if self.thread is not None:
+            self.thread.join(CAMERA_CAPTURE_TIMEOUT)
+            self.thread = None
+
+# Drives the motors at a fixed rate from the latest perception result, stopping them when perception goes stale
+class ControlLoop:
+    """
+    Each tick picks up the newest perception result, if there is one, and updates the PID controllers with
+    the measured time between the frames' capture times. The motors hold their command between results.
+    If no frame with lanes has been captured within max_perception_age seconds (lanes lost, or perception
+    stalled), the motors are stopped and the controllers reset until lanes are seen again.
+    Ticks are scheduled against absolute deadlines; a tick that overruns skips the deadlines it missed.
+    """
+
+    def __init__(self, motor_l, motor_r, pid_lane, pid_mio, telemetry=None, rate=CONTROL_LOOP_RATE, max_perception_age=PERCEPTION_MAX_AGE, start_time=None):
+        self.motor_l = motor_l
+        self.motor_r = motor_r
+        self.pid_lane = pid_lane
+        self.pid_mio = pid_mio
+        self.telemetry = telemetry
+        self.period = 1 / rate
+        self.max_perception_age = max_perception_age
+        self.last_result = None
+        self.last_lane_capture_time = None # Capture time of the last frame used for control; None while stopped
+        self.overrun_count = 0
+        self.start_time = start_time # Startup time, for reporting the time to the first motor command
+        self.first_command_time = None
+
+    # Applies a new perception result and returns the motor PWMs, or None if it has no lanes
+    def apply(self, result):
+        if result.lane_offset is None:
+            # No lanes detected; keep the previous command until perception goes stale
+            return None
+
+        dt = None if self.last_lane_capture_time is None else result.capture_time - self.last_lane_capture_time
+        self.last_lane_capture_time = result.capture_time
+
+        motor_l_speed, motor_r_speed = compute_motor_speeds(self.pid_lane, self.pid_mio, result.lane_offset, result.mio_distance, dt)
+        motor_pwms = set_motor_speeds(self.motor_l, motor_l_speed, self.motor_r, motor_r_speed)
+
+        if self.first_command_time is None:
+            self.first_command_time = time.perf_counter()
+            if self.start_time is not None:
+                print(f"Time to first motor command: {self.first_command_time - self.start_time:.2f} s")
+
+        if DEBUG:
+            print(f"Motor PWMs - Left: {motor_pwms[0]:.2f}, Right: {motor_pwms[1]:.2f}")
+        return motor_pwms
+
+    def safe_stop(self):
+        stop_motors(self.motor_l, self.motor_r)
+        self.pid_lane.reset()
+        self.pid_mio.reset()
+        self.last_lane_capture_time = None
+
+        if DEBUG:
+            print("Perception is stale, motors stopped")
+
+    def step(self, result):
+        if result is not None and result is not self.last_result:
+            # Frames the camera dropped or whose results were replaced before this tick
+            dropped_frames = result.frame_id - (self.last_result.frame_id if self.last_result is not None else -1) - 1
+            self.last_result = result
+            motor_pwms = self.apply(result)
+
+            if self.telemetry is not None:
+                stage_durations = result.stage_durations if result.stage_durations is not None else {}
+                # End-to-end latency runs from frame capture to the motor command
+                stage_durations["end_to_end"] = time.perf_counter() - result.capture_time
+                self.telemetry.record_frame(
+                    result.frame_id, result.capture_time, dropped_frames, result.degradation_level, result.lane_offset, result.mio_distance,
+                    self.pid_lane, self.pid_mio, motor_pwms, stage_durations
+                )
+
+        if self.last_lane_capture_time is not None and time.perf_counter() - self.last_lane_capture_time > self.max_perception_age:
+            self.safe_stop()
+
+    # Runs until the perception thread fails; the motors are stopped on the way out
+    def run(self, perception_thread):
+        next_tick_time = time.perf_counter()
+
+        try:
+            while perception_thread.error is None:
+                self.step(perception_thread.latest_result)
+
+                next_tick_time += self.period
+                delay = next_tick_time - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    self.overrun_count += 1
+                    next_tick_time = time.perf_counter()
+
+            raise RuntimeError("Perception stopped") from perception_thread.error
+        finally:
+            stop_motors(self.motor_l, self.motor_r)
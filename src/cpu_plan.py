@@ -0,0 +1,46 @@
+import os
+
+import cv2
+
+from config import CPU_PLANS, CPU_PLAN
+
+# Process defaults, restored for settings a plan leaves out
+AVAILABLE_CORES = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else None
+DEFAULT_OPENCV_THREADS = cv2.getNumThreads()
+
+cpu_plan_name = CPU_PLAN
+process_cpu_settings = {} # Settings of the role this process was given
+
+# Selects the plan used by perception engines started from now on
+def set_cpu_plan(name):
+    global cpu_plan_name
+
+    if name not in CPU_PLANS:
+        raise ValueError(f"Unknown CPU plan {name!r}; choose from {', '.join(CPU_PLANS)}")
+    cpu_plan_name = name
+
+def get_cpu_plan():
+    return CPU_PLANS[cpu_plan_name]
+
+# Returns the settings of a role in the current plan
+def get_role_cpu_settings(role):
+    return get_cpu_plan().get(role, {})
+
+# Pins this process to its cores and limits OpenCV's threads, as given by the settings of its role.
+# Call it before the process starts other threads, since threads only inherit the affinity they start with.
+def apply_cpu_settings(settings):
+    global process_cpu_settings
+    process_cpu_settings = settings
+
+    if AVAILABLE_CORES is not None:
+        cores = [core for core in settings.get("cores", AVAILABLE_CORES) if core in AVAILABLE_CORES]
+        if not cores:
+            print(f"None of the cores {settings['cores']} are available, using all cores")
+            cores = AVAILABLE_CORES
+        os.sched_setaffinity(0, cores)
+
+    cv2.setNumThreads(settings.get("opencv_threads", DEFAULT_OPENCV_THREADS))
+
+# Returns a thread count from the settings applied to this process, or the default if they do not set it
+def get_process_thread_count(name, default):
+    return process_cpu_settings.get(name, default)
@@ -0,0 +1,147 @@
+import atexit
+import multiprocessing
+import os
+import queue
+
+import cv2
+
+from config import (
+    DEBUG_VIEW_MODE,
+    DEBUG_VIEW_QUEUE_SIZE,
+    DEBUG_VIEW_OUTPUT_DIR,
+    DEBUG_VIEW_VIDEO_FPS
+)
+
+debug_queue = None # Queue of the debug viewer in this process; debug images are discarded while it is None
+debug_viewer = None
+
+# Sets the queue that debug images published in this process go to (the perception workers get the viewer's queue)
+def set_debug_queue(image_queue):
+    global debug_queue
+    debug_queue = image_queue
+
+def get_debug_queue():
+    return debug_queue
+
+# Sends a named debug image to the viewer without ever waiting for it.
+# If the queue is full, the oldest image is dropped to make room; if it is still full, this image is dropped.
+def publish_debug_image(name, image):
+    if debug_queue is None:
+        return
+
+    # Perception reuses its buffers, so the queue gets a copy
+    item = (name, image.copy())
+    try:
+        debug_queue.put_nowait(item)
+    except queue.Full:
+        try:
+            debug_queue.get_nowait()
+            debug_queue.put_nowait(item)
+        except (queue.Empty, queue.Full):
+            pass
+
+# Converts a debug image to the 3-channel BGR frames that windows and video writers expect
+def to_bgr(image):
+    if image.ndim == 2:
+        return cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+    if image.shape[2] == 4:
+        return cv2.cvtColor(image, cv2.COLOR_BGRA2BGR)
+    return image
+
+# Returns the mode to run the viewer in, resolving "auto" to "display" only if there is a screen to display on
+def resolve_view_mode(mode):
+    if mode != "auto":
+        return mode
+    has_display = os.name == "nt" or bool(os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY"))
+    return "display" if has_display else "video"
+
+# Shows or records debug images until it receives None
+def run_debug_viewer(image_queue, mode, output_dir, video_fps):
+    video_writers = {}
+    image_counts = {}
+
+    if mode != "display":
+        os.makedirs(output_dir, exist_ok=True)
+
+    try:
+        while True:
+            item = image_queue.get()
+            if item is None:
+                break
+
+            name, image = item
+            image = to_bgr(image)
+            file_name = name.lower().replace(" ", "_")
+
+            if mode == "display":
+                cv2.imshow(name, image)
+                cv2.waitKey(1)
+            elif mode == "video":
+                if name not in video_writers:
+                    video_path = os.path.join(output_dir, f"{file_name}.avi")
+                    video_size = (image.shape[1], image.shape[0])
+                    video_writers[name] = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*"MJPG"), video_fps, video_size)
+                video_writers[name].write(image)
+            else:
+                image_count = image_counts.get(name, 0)
+                cv2.imwrite(os.path.join(output_dir, f"{file_name}_{image_count:06d}.png"), image)
+                image_counts[name] = image_count + 1
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for video_writer in video_writers.values():
+            video_writer.release()
+        if mode == "display":
+            cv2.destroyAllWindows()
+
+# Displays or records the debug images of every perception process in a separate process, so perception never waits for it
+class DebugViewer:
+    """
+    Images are passed through a bounded queue. When the viewer falls behind, the oldest images are dropped.
+    In "video" mode each image name is written to its own video file; in "images" mode, to a numbered image sequence.
+    """
+
+    def __init__(self, mode=DEBUG_VIEW_MODE, queue_size=DEBUG_VIEW_QUEUE_SIZE, output_dir=DEBUG_VIEW_OUTPUT_DIR, video_fps=DEBUG_VIEW_VIDEO_FPS):
+        self.mode = resolve_view_mode(mode)
+        self.queue = multiprocessing.Queue(queue_size)
+        self.process = multiprocessing.Process(
+            target=run_debug_viewer,
+            args=(self.queue, self.mode, output_dir, video_fps),
+            name="debug-viewer",
+            daemon=True
+        )
+        self.process.start()
+
+        if self.mode != "display":
+            print(f"Recording debug {self.mode} to {output_dir}")
+
+    def stop(self, timeout=5.0):
+        try:
+            self.queue.put(None, timeout=timeout) # Waits for room, since the stop message must not be dropped
+        except queue.Full:
+            pass
+
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+
+# Starts the debug viewer if needed; debug images published in this process, and in perception workers started
+# afterwards, go to it
+def start_debug_viewer():
+    global debug_viewer
+
+    if debug_viewer is None:
+        debug_viewer = DebugViewer()
+        set_debug_queue(debug_viewer.queue)
+        atexit.register(stop_debug_viewer)
+    return debug_viewer
+
+# Stops the debug viewer after it has handled the images already queued
+def stop_debug_viewer():
+    global debug_viewer
+
+    if debug_viewer is not None:
+        set_debug_queue(None)
+        debug_viewer.stop()
+        debug_viewer = None
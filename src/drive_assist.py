@@ -1,24 +1,67 @@
-import multiprocessing
+import atexit
 
+import cv2
+
+from config import DEBUG, FRAME_WIDTH, FRAME_HEIGHT, LANE_TRACKING, OBJECT_DETECTION_INTERVAL, LOAD_GOVERNOR_ENABLED
+from debug_view import start_debug_viewer, publish_debug_image
 from lane_detection import detect_lanes
+from lane_tracking import LaneTracker
 from object_detection import detect_objects, find_mio
+from object_tracking import TrackedObjectDetector
+from perception_engine import PerceptionEngine
+from stage_timer import stage_timer
+
+perception_engine = None
+
+# Returns the configured lane and object detection stages
+def create_perception_stages():
+    lane_stage = LaneTracker() if LANE_TRACKING else detect_lanes
+    # The load governor may raise the detection interval, which needs the tracker
+    object_stage = TrackedObjectDetector() if OBJECT_DETECTION_INTERVAL > 1 or LOAD_GOVERNOR_ENABLED else detect_objects
+    return lane_stage, object_stage
+
+# Returns the shared perception engine, starting its lane and object detection workers on first use
+def get_perception_engine():
+    global perception_engine
+
+    if perception_engine is None:
+        if DEBUG:
+            # Started first, so the workers publish their debug images to it
+            start_debug_viewer()
+        perception_engine = PerceptionEngine(*create_perception_stages())
+        atexit.register(shutdown_perception_engine)
+    return perception_engine
 
-# Processes an image and returns lane offset and distance to the closest in-lane object (MIO)
-def get_lane_offset_and_mio_distance(image):
-    lane_detection_queue = multiprocessing.Queue()
-    object_detection_queue = multiprocessing.Queue()
+# Starts the perception workers if needed and waits until their models are loaded and warmed up
+def wait_for_perception_ready():
+    get_perception_engine().wait_until_ready()
 
-    # Run lane and object detection in parallel
-    lane_detection_process = multiprocessing.Process(target=detect_lanes, args=(image, lane_detection_queue))
-    object_detection_process = multiprocessing.Process(target=detect_objects, args=(image, object_detection_queue))
-    lane_detection_process.start()
-    object_detection_process.start()
+# Sets the degradation level the perception workers use from the next frame on
+def set_degradation_level(level):
+    get_perception_engine().degradation_level = level
 
-    # Wait for both processes to complete and retrieve results
-    lane_detection_process.join()
-    object_detection_process.join()
-    lane_detection_result = lane_detection_queue.get()
-    object_detection_result = object_detection_queue.get()
+# Stops the perception workers and releases their shared memory
+def shutdown_perception_engine():
+    global perception_engine
+
+    if perception_engine is not None:
+        perception_engine.close()
+        perception_engine = None
+
+# Publishes the frame with the detected objects (thin boxes) and the MIO (thick box) to the debug viewer
+def publish_objects_view(image, object_detection_result, mio):
+    objects_view = cv2.resize(image, (FRAME_WIDTH, FRAME_HEIGHT))
+    for box in object_detection_result:
+        cv2.rectangle(objects_view, (int(box[0]), int(box[1])), (int(box[2]), int(box[3])), (255, 255, 0), 1)
+    if mio is not None:
+        cv2.rectangle(objects_view, (int(mio[0]), int(mio[1])), (int(mio[2]), int(mio[3])), (0, 0, 255), 3)
+    publish_debug_image("Objects", objects_view)
+
+# Processes an image and returns lane offset and distance to the closest in-lane object (MIO).
+# Lanes are detected on lane_image instead if one is given (e.g. the camera's lores luma plane).
+def get_lane_offset_and_mio_distance(image, lane_image=None):
+    # Run lane and object detection in parallel on the long-lived workers
+    lane_detection_result, object_detection_result = get_perception_engine().process(image, lane_image)
 
     # Get lane center line and offset
     c_line_fit, lane_offset = lane_detection_result
@@ -28,6 +71,10 @@ def get_lane_offset_and_mio_distance(image):
         return None, None
 
     # Get distance to closest in-lane object (MIO)
-    _, mio_distance = find_mio(c_line_fit, object_detection_result)
+    with stage_timer.time("find_mio"):
+        mio, mio_distance = find_mio(c_line_fit, object_detection_result)
+
+    if DEBUG:
+        publish_objects_view(image, object_detection_result, mio)
 
-    return lane_offset, mio_distance
\ No newline at end of file
+    return lane_offset, mio_distance
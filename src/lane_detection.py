@@ -5,105 +5,276 @@ from config import (
     DEBUG,
     SLIDING_WINDOW_HALF_WIDTH,
     SLIDING_WINDOW_HEIGHT,
-    FRAME_WIDTH,
-    FRAME_HEIGHT,
+    FRAME_CHANNELS,
     WARPED_FRAME_WIDTH,
     WARPED_FRAME_HEIGHT,
     WARPED_LANE_WIDTH,
     WARPED_VEHICLE_X,
-    LANE_LINES
+    WARP_PERSPECTIVE_BG_COLOR,
+    LANE_LINES,
+    LANE_MASK_BEFORE_WARP
 )
+from debug_view import publish_debug_image
+from lane_geometry import get_lane_geometry
+from lane_model import fit_lane_line, evaluate_fit, get_lane_polylines
+from load_governor import perception_settings
+from stage_timer import stage_timer
 from utils import (
+    buffer_pool,
     clamp_value,
     map_value,
-    color_mask,
-    warp_perspective
+    merge_color_ranges,
+    multi_range_mask,
+    multi_color_mask
 )
 
+# Thresholds frames against the lane line color ranges in a single HSV conversion, reusing its buffers
+class LaneLinesMask:
+    def __init__(self, lane_lines):
+        # Lane lines usually share a color range, so most configurations reduce to a single range
+        self.color_ranges = merge_color_ranges([lane_line["mask_color_range"] for lane_line in lane_lines])
+
+        # Single-channel (luma) frames carry no hue or saturation, so only the value bounds apply to them
+        self.luma_ranges = merge_color_ranges([(lower_bound[2:], upper_bound[2:]) for lower_bound, upper_bound in self.color_ranges])
+
+        # Mask value of the background that fills empty areas when a color frame is warped
+        bg_pixel = np.uint8([[WARP_PERSPECTIVE_BG_COLOR]])
+        self.bg_value = int(multi_color_mask(bg_pixel, self.color_ranges)[0, 0])
+
+    def get_buffers(self, height, width):
+        return (
+            buffer_pool.get("lane_lines_mask", (height, width)), # Output mask
+            buffer_pool.get("lane_lines_hsv", (height, width, 3)), # HSV frame
+            buffer_pool.get("lane_lines_range_mask", (height, width)) # Per-range mask
+        )
+
+    # Returns the mask of a BGR(A) or luma frame; it is written into a buffer that is reused by the next call unless dst is given
+    def apply(self, frame, dst=None):
+        mask, hsv, range_mask = self.get_buffers(*frame.shape[:2])
+        mask = mask if dst is None else dst
+
+        if frame.ndim == 2:
+            return multi_range_mask(frame, self.luma_ranges, mask, range_mask)
+        return multi_color_mask(frame, self.color_ranges, mask, hsv, range_mask)
+
+lane_lines_masker = LaneLinesMask(LANE_LINES)
+
+# Reserve the bird's-eye view buffers of a camera frame so the first frames do not allocate them
+WARPED_SHAPE = get_lane_geometry().warped_shape
+buffer_pool.reserve([
+    ("warped_frame", WARPED_SHAPE + (FRAME_CHANNELS,)),
+    ("lane_lines_mask", WARPED_SHAPE),
+    ("lane_lines_hsv", WARPED_SHAPE + (3,)),
+    ("lane_lines_range_mask", WARPED_SHAPE),
+    ("eroded_lane_lines_mask", WARPED_SHAPE),
+    ("component_labels", WARPED_SHAPE, np.uint16),
+    ("line_mask", WARPED_SHAPE),
+    ("component_mask", WARPED_SHAPE)
+])
+
 # Masks an image based on config-defined lane line color ranges
-def apply_lane_lines_mask(frame):
-    height, width, _ = frame.shape
-    lane_line_mask = np.zeros((height, width), dtype=np.uint8)
+def apply_lane_lines_mask(frame, dst=None):
+    return lane_lines_masker.apply(frame, dst)
 
-    for lane_line in LANE_LINES:
-        mask = color_mask(frame, lane_line["mask_color_range"][0], lane_line["mask_color_range"][1])
-        lane_line_mask = cv2.bitwise_or(lane_line_mask, mask)
+# Computes the column histogram of every sliding window band from a given bottom row upwards in one pass
+def compute_band_histograms(frame, bottom_y, window_height=SLIDING_WINDOW_HEIGHT):
+    full_band_count = bottom_y // window_height
+    bands = frame[bottom_y - full_band_count * window_height:bottom_y]
+    histograms = bands.reshape(full_band_count, window_height, -1).sum(axis=1, dtype=np.int32)[::-1]
 
-    return lane_line_mask 
+    if bottom_y % window_height:
+        # The topmost window would start above the frame and contains no rows
+        histograms = np.vstack((histograms, np.zeros((1, frame.shape[1]), dtype=np.int32)))
+    return histograms
 
 # Finds points along a lane line mask using a sliding window from a given start coordinate
-def find_points_using_sliding_window(frame, base_x, base_y=0):
-    sliding_window_eval_y = frame.shape[0] - base_y
-    points = []
-    annotations_frame = frame.copy()
-
-    while sliding_window_eval_y > 0:
-        left_limit = base_x - SLIDING_WINDOW_HALF_WIDTH
-        right_limit = base_x + SLIDING_WINDOW_HALF_WIDTH
-        top_limit = sliding_window_eval_y - SLIDING_WINDOW_HEIGHT
-        bottom_limit = sliding_window_eval_y
-
-        window = frame[top_limit:bottom_limit, left_limit:right_limit]     
-        sum = np.sum(window, axis=0)
-
-        if (len(sum) == 0):      
-            # Shift right if no pixels found in the window
-            base_x += SLIDING_WINDOW_HALF_WIDTH
-            sliding_window_eval_y -= SLIDING_WINDOW_HEIGHT
+def find_points_using_sliding_window(frame, base_x, base_y=0, window_half_width=SLIDING_WINDOW_HALF_WIDTH, window_height=SLIDING_WINDOW_HEIGHT):
+    height, width = frame.shape[:2]
+    eval_ys = range(height - base_y, 0, -window_height)
+    histograms = compute_band_histograms(frame, height - base_y, window_height)
+    points = np.empty((len(eval_ys), 2), dtype=np.int64)
+    point_count = 0
+
+    if DEBUG:
+        annotations_frame = frame.copy()
+
+    for histogram, sliding_window_eval_y in zip(histograms, eval_ys):
+        left_limit = base_x - window_half_width
+        right_limit = base_x + window_half_width
+
+        if left_limit < 0 or left_limit >= width:
+            # Shift right if the window starts outside the frame
+            base_x += window_half_width
             continue
 
-        argmax = np.argmax(sum) + base_x - SLIDING_WINDOW_HALF_WIDTH
-        try:
-            if (frame[sliding_window_eval_y - 1, argmax] == 0):
-                # Skip if the peak column has no active pixels
-                sliding_window_eval_y -= SLIDING_WINDOW_HEIGHT 
-                continue
-        except Exception as _:
-            # Skip if out of frame bounds
-            sliding_window_eval_y -= SLIDING_WINDOW_HEIGHT
+        argmax = int(np.argmax(histogram[left_limit:min(right_limit, width)])) + left_limit
+        if frame[sliding_window_eval_y - 1, argmax] == 0:
+            # Skip if the peak column has no active pixels
             continue
-        
-        points.append((argmax, sliding_window_eval_y))
 
-        # Draw window rectangle and peak point for debugging
-        cv2.rectangle(annotations_frame, (left_limit, bottom_limit), (right_limit, top_limit), (255, 0, 255), 2)
-        cv2.circle(annotations_frame, (argmax, sliding_window_eval_y), 4, (0, 255, 0), -1)
-        
+        points[point_count] = argmax, sliding_window_eval_y
+        point_count += 1
+
+        if DEBUG:
+            # Draw window rectangle and peak point for debugging
+            top_limit = sliding_window_eval_y - window_height
+            cv2.rectangle(annotations_frame, (left_limit, sliding_window_eval_y), (right_limit, top_limit), (255, 0, 255), 2)
+            cv2.circle(annotations_frame, (argmax, sliding_window_eval_y), 4, (0, 255, 0), -1)
+
         base_x = argmax
-        sliding_window_eval_y -= SLIDING_WINDOW_HEIGHT
 
     if DEBUG:
-        cv2.imshow("Sliding window annotations", annotations_frame)
-    return points
+        publish_debug_image("Sliding window annotations", annotations_frame)
+    return points[:point_count]
 
-# Plots lane lines by fitting a polynomial to center line points and offsetting them
-def plot_lane_lines(frame, c_line_points):
-    if (len(c_line_points) == 0):
+# Plots the left, center and right lane lines of a center line fit in the full-scale bird's-eye view
+def plot_lane_lines(frame, c_line_fit):
+    if c_line_fit is None:
         return frame
-    
-    base_frame = frame
-    c_line_fit = np.polyfit([point[1] for point in c_line_points], [point[0] for point in c_line_points], 2)
-    y_vals = np.arange(WARPED_FRAME_HEIGHT)
-
-    c_x_vals = np.polyval(c_line_fit, y_vals)
-    ref_points = np.array(list(zip(c_x_vals, y_vals)), dtype=np.int32)
-    for point in ref_points:
-        cv2.circle(base_frame, point, 4, (255, 255, 255), -1)
 
-    l_x_vals = [x - WARPED_LANE_WIDTH for x in c_x_vals]
-    l_points = np.array(list(zip(l_x_vals, y_vals)), dtype=np.int32)
-    for point in l_points:
-        cv2.circle(base_frame, point, 4, (255, 255, 255), -1)
+    polylines = get_lane_polylines(c_line_fit, np.arange(WARPED_FRAME_HEIGHT), WARPED_LANE_WIDTH)
+    cv2.polylines(frame, list(polylines), False, (255, 255, 255), 9)
+    return frame
+
+# Moves an image to the bird's-eye view of the lane geometry's scale and returns the lane lines mask. Images of
+# any size are warped directly, so a small lores frame is never upscaled. The masker and whether to erode default to
+# the configured lane lines and the degradation level (a parameter sweep overrides them).
+# The mask is written into dst if given, or else into a pooled buffer that is reused by the next call.
+def extract_lane_lines_mask(image, geometry=None, masker=lane_lines_masker, erode=None, dst=None):
+    geometry = get_lane_geometry() if geometry is None else geometry
+    erode = not perception_settings.skip_erode if erode is None else erode
+    is_eroded = erode and geometry.erode_kernel is not None
+    warped_shape = geometry.warped_shape
+    warper = geometry.get_warper((image.shape[1], image.shape[0]))
+
+    # Unless it is eroded afterwards, the mask goes straight to the output buffer
+    mask_dst = None if is_eroded else dst
+
+    # Extract lane lines mask in the bird's-eye view and erode it to reduce noise
+    if LANE_MASK_BEFORE_WARP:
+        # Threshold the original frame and warp only the single-channel mask
+        with stage_timer.time("mask"):
+            lane_lines_mask = masker.apply(image)
+        with stage_timer.time("warp"):
+            mask_dst = buffer_pool.get("warped_lane_lines_mask", warped_shape) if mask_dst is None else mask_dst
+            lane_lines_mask = warper.warp_mask(lane_lines_mask, masker.bg_value, mask_dst)
+    else:
+        with stage_timer.time("warp"):
+            warped_frame = warper.warp(image, dst=buffer_pool.get("warped_frame", warped_shape + image.shape[2:]))
+        with stage_timer.time("mask"):
+            lane_lines_mask = masker.apply(warped_frame, mask_dst)
+    if is_eroded:
+        with stage_timer.time("erode"):
+            erode_dst = buffer_pool.get("eroded_lane_lines_mask", warped_shape) if dst is None else dst
+            lane_lines_mask = cv2.erode(lane_lines_mask, geometry.erode_kernel, dst=erode_dst, iterations=1)
+
+    # Debugging: Publish the warped image and lane lines mask to the debug viewer
+    if (DEBUG):
+        publish_debug_image("Warped Image", warper.warp(image) if LANE_MASK_BEFORE_WARP else warped_frame)
+        publish_debug_image("Lane Lines Mask", lane_lines_mask)
+
+    return lane_lines_mask
+
+# Labels the connected components of a mask, using 16-bit labels unless there are too many components
+def label_components(mask):
+    try:
+        labels = buffer_pool.get("component_labels", mask.shape, np.uint16)
+        return cv2.connectedComponentsWithStats(mask, labels=labels, connectivity=8, ltype=cv2.CV_16U)
+    except cv2.error:
+        labels = buffer_pool.get("component_labels_32", mask.shape, np.int32)
+        return cv2.connectedComponentsWithStats(mask, labels=labels, connectivity=8, ltype=cv2.CV_32S)
+
+# Builds a mask of the given connected components by looking them up in the label image, reusing pooled buffers
+def select_components(labels, selected_labels):
+    mask = cv2.compare(labels, int(selected_labels[0]), cv2.CMP_EQ, dst=buffer_pool.get("line_mask", labels.shape))
+    component_mask = buffer_pool.get("component_mask", labels.shape)
+    for label in selected_labels[1:]:
+        cv2.bitwise_or(mask, cv2.compare(labels, int(label), cv2.CMP_EQ, dst=component_mask), dst=mask)
+    return mask
+
+# Finds center line points in a lane lines mask by classifying line components and searching them with a sliding window.
+# The mask is in the bird's-eye view of the lane geometry's scale; the points are returned in the full-scale view.
+def find_c_line_points(lane_lines_mask, geometry=None):
+    geometry = get_lane_geometry() if geometry is None else geometry
+
+    with stage_timer.time("components"):
+        label_count, labels, stats, centroids = label_components(lane_lines_mask)
+
+    # Classify components (label 0 is the background) by area
+    component_labels = np.arange(1, label_count)
+    areas = stats[1:, cv2.CC_STAT_AREA]
+    dashed_line_labels = component_labels[(areas >= geometry.dashed_line_min_area) & (areas < geometry.solid_line_min_area)] # Medium components are likely dashed lines (center line)
+    solid_line_labels = component_labels[areas >= geometry.solid_line_min_area] # Large components are likely solid lines (left or right lines); small ones are likely noise
+
+    # Ignore solid line components that end in the upper half of the frame as they cannot be reliably categorized
+    bottom_ys = stats[solid_line_labels, cv2.CC_STAT_TOP] + stats[solid_line_labels, cv2.CC_STAT_HEIGHT] - 1
+    is_in_lower_half = bottom_ys >= geometry.warped_height // 2
+    solid_line_labels = solid_line_labels[is_in_lower_half]
+    bottom_ys = bottom_ys[is_in_lower_half]
+
+    # Classify the remaining solid line components as left or right by the x-coordinate of their bottom point
+    bottom_xs = np.array([np.argmax(labels[bottom_y] == label) for label, bottom_y in zip(solid_line_labels, bottom_ys)], dtype=np.int64)
+    is_left_half = bottom_xs < geometry.warped_width // 2
+    l_line_labels = solid_line_labels[is_left_half]
+    r_line_labels = solid_line_labels[~is_left_half]
 
-    r_x_vals = [x + WARPED_LANE_WIDTH for x in c_x_vals]
-    r_points = np.array(list(zip(r_x_vals, y_vals)), dtype=np.int32)
-    for point in r_points:
-        cv2.circle(base_frame, point, 4, (255, 255, 255), -1)
+    """
+    We estimate center line points by applying a sliding window on visible line components. 
+    Solid lines are more reliable than dashed lines for the sliding window approach, 
+    so we check for them in the following order:
+    1. Solid right line (since the vehicle is driving on the right lane).
+    2. Solid left line.
+    3. Dashed center line.
+    """    
 
-    return base_frame
+    # Initialize array for center line points
+    c_line_points = np.empty((0, 2), dtype=np.int64)
+
+    if (len(r_line_labels)): # Right line is visible
+        r_line_mask = select_components(labels, r_line_labels)
+        with stage_timer.time("sliding_window"):
+            r_line_points = find_points_using_sliding_window(
+                r_line_mask, geometry.line_initial_xs[2], 0, geometry.sliding_window_half_width, geometry.sliding_window_height
+            )
+        c_line_points = r_line_points - (geometry.lane_width, 0)
+    elif (len(l_line_labels)): # Left line is visible
+        l_line_mask = select_components(labels, l_line_labels)
+        with stage_timer.time("sliding_window"):
+            l_line_points = find_points_using_sliding_window(
+                l_line_mask, geometry.line_initial_xs[0], geometry.left_line_base_y, geometry.sliding_window_half_width, geometry.sliding_window_height
+            )
+        c_line_points = l_line_points + (geometry.lane_width, 0)
+    elif (len(dashed_line_labels)): # Only center line is visible
+        # Use the centroid of each dash
+        c_line_points = centroids[dashed_line_labels].astype(np.int64)
+
+    return geometry.to_full_scale_points(c_line_points)
+
+# Publishes the lane lines predicted by a center line fit to the debug viewer, without waiting for it
+def publish_predicted_lane_lines(lane_lines_mask, c_line_fit):
+    predicted_lines_plot = np.zeros((WARPED_FRAME_HEIGHT, WARPED_FRAME_WIDTH), dtype=lane_lines_mask.dtype)
+    predicted_lines_plot = plot_lane_lines(predicted_lines_plot, c_line_fit)
+    publish_debug_image("Predicted Lines Plot", predicted_lines_plot)
+
+# Fits a quadratic to center line points given as an (N, 2) array of [x, y] pairs, optionally weighted, rejecting outliers
+def fit_c_line(c_line_points, weights=None):
+    with stage_timer.time("polyfit"):
+        return fit_lane_line(c_line_points, weights)
+
+# Computes the vehicle's offset from the lane center, mapped for PID control
+def compute_lane_offset(c_line_fit):
+    # Determine the center of the lane at the bottom of the warped frame
+    decision_eval_y = WARPED_FRAME_HEIGHT
+    lane_half_width = WARPED_LANE_WIDTH // 2
+    lane_center = int(evaluate_fit(c_line_fit, decision_eval_y)) + lane_half_width  # Add half a lane width (vehicle is in the right-hand lane)
+
+    # Calculate the lane offset (vehicle's offset from the lane center)
+    lane_offset = clamp_value(WARPED_VEHICLE_X - lane_center, -lane_half_width, lane_half_width)
+    lane_offset = round(map_value(lane_offset, -lane_half_width, lane_half_width, -63, 63))  # Map lane offset for PID control
+    return lane_offset
 
 # Detects lane lines in an image and returns the fitted center line and lane offset
-def detect_lanes(image, result_queue):
+def detect_lanes(image, result_queue=None):
     """
     We assume a two-lane setup in the following manner: 
     - A solid left line (l), a dashed center line (c), and a solid right line (r). 
@@ -111,111 +282,24 @@ def detect_lanes(image, result_queue):
     - In the bird's-eye view, knowing one line's points lets us estimate the other lines by applying an offset (WARPED_LANE_WIDTH).
     """    
 
-    frame = cv2.resize(image, (FRAME_WIDTH, FRAME_HEIGHT))
-    warped_frame = warp_perspective(frame)
+    geometry = get_lane_geometry()
+    lane_lines_mask = extract_lane_lines_mask(image, geometry)
+    c_line_points = find_c_line_points(lane_lines_mask, geometry)
 
-    # Extract lane lines mask from the warped frame and erode it to reduce noise
-    lane_lines_mask = apply_lane_lines_mask(warped_frame)
-    lane_lines_mask = cv2.erode(lane_lines_mask,  np.ones((3, 3), np.uint8), iterations=1)
-
-    contours, _ = cv2.findContours(lane_lines_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-    # Initialize lists for storing solid and dashed line contours
-    solid_line_contours = []
-    dashed_line_contours = []
-
-    for contour in contours:
-        area = cv2.contourArea(contour)
-        if (area < 200):
-            # Small contours are likely noise
-            continue
-        elif (area < 900):
-            # Medium contours are likely dashed lines (center line)
-            dashed_line_contours.append(contour)
-        else:
-            # Large contours are likely solid lines (left or right lines)
-            solid_line_contours.append(contour)
-    
-    # Initialize lists for left and right line contours
-    l_line_contours = []
-    r_line_contours = []
-
-    # Categorize solid line contours as belonging to the left or right line based on their position
-    for contour in solid_line_contours:
-        bottom_point = max(contour, key=lambda x: x[0][1])
-        bottom_x = bottom_point[0][0]
-        bottom_y = bottom_point[0][1]
-
-        if bottom_y < WARPED_FRAME_HEIGHT // 2:
-            # Ignore contours in the upper half of the frame as they cannot be reliably categorized
-            continue
-        else:
-            # Classify contours in the lower half of the frame based on their horizontal position
-            if bottom_x < WARPED_FRAME_WIDTH // 2: # Left half of the frame
-                l_line_contours.append(contour)
-            else: # Right half of the frame
-                r_line_contours.append(contour)   
-
-    # Create masks for left, center, and right lane lines
-    l_line_mask = np.zeros_like(lane_lines_mask)
-    c_line_mask = np.zeros_like(lane_lines_mask)
-    r_line_mask = np.zeros_like(lane_lines_mask)
-    cv2.drawContours(l_line_mask, l_line_contours, -1, (255, 255, 255), cv2.FILLED)
-    cv2.drawContours(c_line_mask, dashed_line_contours, -1, (255, 255, 255), cv2.FILLED)
-    cv2.drawContours(r_line_mask, r_line_contours, -1, (255, 255, 255), cv2.FILLED)    
-
-    """
-    We estimate center line points by applying a sliding window on visible line contours. 
-    Solid line contours are more reliable than dashed lines for the sliding window approach, 
-    so we check for them in the following order:
-    1. Solid right line (since the vehicle is driving on the right lane).
-    2. Solid left line.
-    3. Dashed center line.
-    """    
+    # If center line points are found, fit a curve to them and calculate the lane offset
+    c_line_fit = fit_c_line(c_line_points) if len(c_line_points) else None
 
-    # Initialize list for center line points
-    c_line_points = []
-
-    if (len(r_line_contours)): # Right line is visible
-        r_line_points = find_points_using_sliding_window(r_line_mask, LANE_LINES[2]["initial_x"])
-        c_line_points = [[x - WARPED_LANE_WIDTH, y] for x, y in r_line_points]
-    elif (len(l_line_contours)): # Left line is visible
-        l_line_points = find_points_using_sliding_window(l_line_mask, LANE_LINES[0]["initial_x"], 100)
-        c_line_points = [[x + WARPED_LANE_WIDTH, y] for x, y in l_line_points]
-    elif (len(dashed_line_contours)): # Only center line is visible
-        c_line_points = []
-        for contour in dashed_line_contours:
-            M = cv2.moments(contour)
-            if M['m00'] != 0:
-                cx = int(M['m10'] / M['m00'])
-                cy = int(M['m01'] / M['m00'])
-                c_line_points.append((cx, cy))
-
-    # Debugging: Display the warped image, lane lines mask, and the plot of predicted lane lines
+    # Debugging: Publish the plot of predicted lane lines (in the full-scale view)
     if (DEBUG):
-        cv2.imshow("Warped Image", warped_frame)    
-        cv2.imshow("Lane Lines Mask", lane_lines_mask)    
-        predicted_lines_plot = np.zeros_like(lane_lines_mask)
-        predicted_lines_plot = plot_lane_lines(predicted_lines_plot, c_line_points)
-        cv2.imshow("Predicted Lines Plot", predicted_lines_plot)    
-        cv2.waitKey(0)
+        publish_predicted_lane_lines(lane_lines_mask, c_line_fit)
 
-    # If center line points are found, fit a curve to them and calculate the lane offset
-    if (len(c_line_points)):
-        # Fit a polynomial to the center line points
-        c_line_fit = np.polyfit([point[1] for point in c_line_points], [point[0] for point in c_line_points], 2)
-        
-        # Determine the center of the lane at the bottom of the warped frame
-        decision_eval_y = WARPED_FRAME_HEIGHT
-        lane_half_width = WARPED_LANE_WIDTH // 2
-        lane_center = int(np.polyval(c_line_fit, decision_eval_y)) + lane_half_width  # Add half a lane width (vehicle is in the right-hand lane)
-
-        # Calculate the lane offset (vehicle's offset from the lane center)
-        lane_offset = clamp_value(WARPED_VEHICLE_X - lane_center, -lane_half_width, lane_half_width)
-        lane_offset = round(map_value(lane_offset, -lane_half_width, lane_half_width, -63, 63))  # Map lane offset for PID control
-
-        result_queue.put((c_line_fit, lane_offset))        
+    if c_line_fit is not None:
+        lane_offset = compute_lane_offset(c_line_fit)
+
+        if result_queue is not None:
+            result_queue.put((c_line_fit, lane_offset))
         return c_line_fit, lane_offset
     else: # No center line points found
-        result_queue.put((None, None))        
-        return None, None
\ No newline at end of file
+        if result_queue is not None:
+            result_queue.put((None, None))
+        return None, None
@@ -0,0 +1,83 @@
+import numpy as np
+
+from config import (
+    SLIDING_WINDOW_HALF_WIDTH,
+    SLIDING_WINDOW_HEIGHT,
+    FRAME_WIDTH,
+    FRAME_HEIGHT,
+    WARPED_FRAME_WIDTH,
+    WARPED_FRAME_HEIGHT,
+    WARPED_LANE_WIDTH,
+    LANE_LINES
+)
+from load_governor import perception_settings
+from utils import get_scaled_perspective_warper
+
+# Full-scale lane line component and search parameters
+DASHED_LINE_MIN_AREA = 200 # Components from this area up are likely dashes of the center line; smaller ones are likely noise
+SOLID_LINE_MIN_AREA = 900 # Components from this area up are likely solid (left or right) lines
+LEFT_LINE_BASE_Y = 100 # Rows above the bottom of the frame where the left line search starts
+ERODE_KERNEL_SIZE = 3
+
+# Lane detection parameters for a bird's-eye view scaled by a factor
+class LaneGeometry:
+    """
+    The sliding window size, component area thresholds and perspective points default to the configured full-scale
+    values and can be overridden (e.g. by a parameter sweep). Lengths scale with the factor and areas with its
+    square. Center line points found in the scaled view are converted back to the full-scale view before fitting,
+    so fits, lane offsets and the PID gains do not depend on the scale.
+    """
+
+    def __init__(
+        self,
+        scale,
+        sliding_window_half_width=SLIDING_WINDOW_HALF_WIDTH,
+        sliding_window_height=SLIDING_WINDOW_HEIGHT,
+        dashed_line_min_area=DASHED_LINE_MIN_AREA,
+        solid_line_min_area=SOLID_LINE_MIN_AREA,
+        perspective_points=None
+    ):
+        self.scale = scale
+        self.perspective_points = perspective_points # Original perspective points of the view's corners; None follows the calibration
+        self.warped_width = round(WARPED_FRAME_WIDTH * scale)
+        self.warped_height = round(WARPED_FRAME_HEIGHT * scale)
+        self.sliding_window_half_width = max(1, round(sliding_window_half_width * scale))
+        self.sliding_window_height = max(1, round(sliding_window_height * scale))
+        self.lane_width = round(WARPED_LANE_WIDTH * scale)
+        self.dashed_line_min_area = dashed_line_min_area * scale ** 2
+        self.solid_line_min_area = solid_line_min_area * scale ** 2
+        self.left_line_base_y = round(LEFT_LINE_BASE_Y * scale)
+        self.line_initial_xs = [round(lane_line["initial_x"] * scale) for lane_line in LANE_LINES]
+
+        # Below 2 px the erode would only remove whole line pixels
+        erode_kernel_size = round(ERODE_KERNEL_SIZE * scale)
+        self.erode_kernel = np.ones((erode_kernel_size, erode_kernel_size), np.uint8) if erode_kernel_size > 1 else None
+
+    @property
+    def warped_shape(self):
+        return (self.warped_height, self.warped_width)
+
+    # Returns the warper from frames of a source size (width, height) to the scaled view
+    def get_warper(self, source_size=(FRAME_WIDTH, FRAME_HEIGHT)):
+        return get_scaled_perspective_warper(self.scale, source_size, self.perspective_points)
+
+    # Mask of the scaled warped frame pixels that show part of the original frame
+    def get_coverage_mask(self):
+        return self.get_warper().get_coverage_mask((FRAME_WIDTH, FRAME_HEIGHT))
+
+    # Converts (N, 2) points from the scaled view to the full-scale view
+    def to_full_scale_points(self, points):
+        return points if self.scale == 1 else points / self.scale
+
+    # Converts a fit x = f(y) from the full-scale view to the scaled view
+    def to_scaled_fit(self, fit):
+        return fit if self.scale == 1 else fit * (1 / self.scale, 1, self.scale)
+
+lane_geometries = {}
+
+# Returns the lane geometry for a scale, by default the scale set by the current degradation level
+def get_lane_geometry(scale=None):
+    scale = perception_settings.lane_scale if scale is None else scale
+    if scale not in lane_geometries:
+        lane_geometries[scale] = LaneGeometry(scale)
+    return lane_geometries[scale]
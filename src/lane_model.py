@@ -0,0 +1,77 @@
+import numpy as np
+
+from config import LANE_FIT_OUTLIER_THRESHOLD, LANE_FIT_MAX_REFITS
+
+# Lane lines are modelled as quadratics x = f(y) in the bird's-eye view, stored as [a, b, c] for a*y^2 + b*y + c
+# (the coefficient order of np.polyfit, so fits can still be passed to np.polyval)
+
+# Fits a quadratic x = f(y) by weighted least squares, solving the 3x3 normal equations in closed form.
+# Points on fewer than three distinct rows get a line or a constant instead, since a quadratic is not determined by them.
+def fit_quadratic(ys, xs, weights=None):
+    ys = np.asarray(ys, dtype=np.float64)
+    xs = np.asarray(xs, dtype=np.float64)
+    weights = np.ones_like(ys) if weights is None else np.asarray(weights, dtype=np.float64)
+
+    # Work in rows centered on their weighted mean and scaled to about [-1, 1], which keeps the system well
+    # conditioned and makes the first moment zero
+    s0 = weights.sum()
+    center = weights @ ys / s0
+    scale = max((ys.max() - ys.min()) / 2, 1.0)
+    t = (ys - center) / scale
+    wt = weights * t
+    wt2 = wt * t
+    s2 = wt2.sum()
+    s3 = wt2 @ t
+    s4 = (wt2 * t) @ t
+    x0 = weights @ xs
+    x1 = wt @ xs
+    x2 = wt2 @ xs
+
+    # Cramer's rule on [[s4, s3, s2], [s3, s2, 0], [s2, 0, s0]] [a, b, c] = [x2, x1, x0]
+    determinant = s0 * (s4 * s2 - s3 * s3) - s2 ** 3
+    if s2 <= 1e-12 * s0:
+        a, b, c = 0.0, 0.0, x0 / s0 # A single row
+    elif determinant <= 1e-9 * s0 * s2 * s4:
+        a, b, c = 0.0, x1 / s2, x0 / s0 # Two rows
+    else:
+        a = (s0 * (x2 * s2 - s3 * x1) - s2 * s2 * x0) / determinant
+        b = (s0 * (s4 * x1 - s3 * x2) + s2 * (s3 * x0 - s2 * x1)) / determinant
+        c = (s4 * s2 * x0 - s3 * (s3 * x0 - s2 * x1) - s2 * s2 * x2) / determinant
+
+    # Expand x = a*t^2 + b*t + c with t = (y - center) / scale back to coefficients of y
+    return np.array((
+        a / scale ** 2,
+        b / scale - 2 * a * center / scale ** 2,
+        a * center ** 2 / scale ** 2 - b * center / scale + c
+    ))
+
+# Evaluates a fit at one row or an array of rows
+def evaluate_fit(fit, ys):
+    a, b, c = fit
+    ys = np.asarray(ys)
+    return (a * ys + b) * ys + c
+
+# Fits a lane line to (N, 2) [x, y] points, refitting without the points farther than outlier_threshold from the fit.
+# The outlier test is skipped if it would leave fewer than three points.
+def fit_lane_line(points, weights=None, outlier_threshold=LANE_FIT_OUTLIER_THRESHOLD, max_refits=LANE_FIT_MAX_REFITS):
+    xs, ys = points[:, 0], points[:, 1]
+    fit = fit_quadratic(ys, xs, weights)
+    is_inlier = np.ones(len(points), dtype=bool)
+
+    for _ in range(max_refits):
+        is_new_inlier = np.abs(xs - evaluate_fit(fit, ys)) <= outlier_threshold
+        if np.array_equal(is_new_inlier, is_inlier) or np.count_nonzero(is_new_inlier) < 3:
+            break
+
+        is_inlier = is_new_inlier
+        fit = fit_quadratic(ys[is_inlier], xs[is_inlier], None if weights is None else weights[is_inlier])
+    return fit
+
+# Returns the left, center and right lane line points of a center line fit on the given rows, as a (3, N, 2) array of
+# int32 [x, y] points that can be drawn with a single cv2.polylines call
+def get_lane_polylines(c_line_fit, ys, lane_width):
+    polylines = np.empty((3, len(ys), 2), dtype=np.int32)
+    xs = evaluate_fit(c_line_fit, ys) + np.array((-lane_width, 0, lane_width))[:, None]
+    polylines[:, :, 0] = np.clip(xs, -2 ** 15, 2 ** 15) # Far outside any frame, but safe to convert
+    polylines[:, :, 1] = ys
+    return polylines
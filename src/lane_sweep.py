@@ -0,0 +1,190 @@
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import time
+
+import cv2
+import numpy as np
+
+from config import (
+    SLIDING_WINDOW_HALF_WIDTH,
+    SLIDING_WINDOW_HEIGHT,
+    FRAME_WIDTH,
+    FRAME_HEIGHT,
+    ORIGINAL_PERSPECTIVE_POINTS,
+    LANE_LINES
+)
+from lane_detection import LaneLinesMask, extract_lane_lines_mask, find_c_line_points, fit_c_line, compute_lane_offset
+from lane_geometry import DASHED_LINE_MIN_AREA, SOLID_LINE_MIN_AREA, LaneGeometry
+from replay import load_frames
+
+# Lane detection parameters that can be swept, with the configured values used when a grid leaves them out
+DEFAULT_PARAMETERS = {
+    "perspective_points": ORIGINAL_PERSPECTIVE_POINTS.tolist(), # Camera frame points of the bird's-eye view corners
+    "lane_scale": 1.0,
+    "mask_color_range": None, # HSV [lower, upper] bounds for every lane line (None uses the ranges in LANE_LINES)
+    "erode": True,
+    "sliding_window_half_width": SLIDING_WINDOW_HALF_WIDTH,
+    "sliding_window_height": SLIDING_WINDOW_HEIGHT,
+    "dashed_line_min_area": DASHED_LINE_MIN_AREA,
+    "solid_line_min_area": SOLID_LINE_MIN_AREA
+}
+
+# Parameters that the lane lines mask depends on. Parameter sets that share them share the mask, so it is
+# computed once per frame.
+MASK_PARAMETERS = ("perspective_points", "lane_scale", "mask_color_range", "erode")
+
+sweep_frames = None # Resized frames of the dataset, set in every pool worker
+maskers = {}
+mask_buffers = {}
+
+# Loads a JSON grid that maps parameter names to lists of values, and returns every combination as a parameter set
+def load_parameter_grid(path):
+    with open(path) as file:
+        grid = json.load(file)
+
+    unknown_names = set(grid) - set(DEFAULT_PARAMETERS)
+    if unknown_names:
+        raise ValueError(f"Unknown sweep parameters: {', '.join(sorted(unknown_names))}")
+
+    names = list(grid)
+    return [{**DEFAULT_PARAMETERS, **dict(zip(names, values))} for values in itertools.product(*grid.values())]
+
+def get_parameter_key(parameters, names):
+    return json.dumps([parameters[name] for name in names])
+
+def initialize_sweep_worker(frames):
+    global sweep_frames
+    sweep_frames = frames
+
+def get_masker(parameters):
+    key = json.dumps(parameters["mask_color_range"])
+    if key not in maskers:
+        lane_lines = LANE_LINES
+        if parameters["mask_color_range"] is not None:
+            lower_bound, upper_bound = (np.array(bound) for bound in parameters["mask_color_range"])
+            lane_lines = [{**lane_line, "mask_color_range": (lower_bound, upper_bound)} for lane_line in LANE_LINES]
+        maskers[key] = LaneLinesMask(lane_lines)
+    return maskers[key]
+
+def create_geometry(parameters):
+    return LaneGeometry(
+        parameters["lane_scale"],
+        parameters["sliding_window_half_width"],
+        parameters["sliding_window_height"],
+        parameters["dashed_line_min_area"],
+        parameters["solid_line_min_area"],
+        parameters["perspective_points"]
+    )
+
+# Returns the lane lines mask of a frame with the detection pipeline, written into a buffer kept for the mask parameters
+def compute_lane_lines_mask(frame, parameters, geometry, mask_key):
+    if mask_key not in mask_buffers:
+        mask_buffers[mask_key] = np.empty(geometry.warped_shape, np.uint8)
+    return extract_lane_lines_mask(frame, geometry, get_masker(parameters), parameters["erode"], dst=mask_buffers[mask_key])
+
+# Runs lane detection with every parameter set on a range of frames, in a pool worker
+def evaluate_frames(parameter_sets, start_index, stop_index):
+    """
+    Returns the lane offset of every parameter set on every frame (NaN where no lanes were found) and the total
+    seconds each parameter set took. A parameter set is charged the full cost of the mask it shares.
+    """
+
+    geometries = [create_geometry(parameters) for parameters in parameter_sets]
+    mask_keys = [get_parameter_key(parameters, MASK_PARAMETERS) for parameters in parameter_sets]
+    lane_offsets = np.full((len(parameter_sets), stop_index - start_index), np.nan)
+    durations = np.zeros(len(parameter_sets))
+
+    for frame_index in range(start_index, stop_index):
+        frame = sweep_frames[frame_index]
+        masks = {}
+        mask_durations = {}
+
+        for set_index, (parameters, geometry) in enumerate(zip(parameter_sets, geometries)):
+            mask_key = mask_keys[set_index]
+
+            if mask_key not in masks:
+                start_time = time.perf_counter()
+                masks[mask_key] = compute_lane_lines_mask(frame, parameters, geometry, mask_key)
+                mask_durations[mask_key] = time.perf_counter() - start_time
+
+            start_time = time.perf_counter()
+            c_line_points = find_c_line_points(masks[mask_key], geometry)
+            if len(c_line_points):
+                lane_offsets[set_index, frame_index - start_index] = compute_lane_offset(fit_c_line(c_line_points))
+            durations[set_index] += time.perf_counter() - start_time + mask_durations[mask_key]
+
+    return lane_offsets, durations
+
+# Summarizes the lane offsets of a parameter set over the dataset
+def summarize_lane_offsets(lane_offsets, duration):
+    is_detected = ~np.isnan(lane_offsets)
+    # Offset stability: mean change in lane offset between consecutive frames that both found lanes
+    is_consecutive = is_detected[1:] & is_detected[:-1]
+    offset_changes = np.abs(np.diff(lane_offsets))[is_consecutive]
+
+    return {
+        "detection_rate": float(np.mean(is_detected)) if len(lane_offsets) else 0.0,
+        "offset_jitter": float(np.mean(offset_changes)) if len(offset_changes) else None,
+        "frame_cost_ms": duration / len(lane_offsets) * 1000 if len(lane_offsets) else 0.0
+    }
+
+# Runs lane detection on every frame of a dataset with every parameter set, spreading frame ranges over a process pool
+def run_sweep(frames, parameter_sets, process_count=None, max_frames=None):
+    """
+    Frames are resized once up front. Within a frame, the warped frame and lane lines mask are computed once per
+    distinct combination of the parameters they depend on. Returns one result per parameter set, in grid order.
+    """
+
+    frames = [cv2.resize(frame, (FRAME_WIDTH, FRAME_HEIGHT)) for frame in itertools.islice(frames, max_frames)]
+    process_count = process_count or os.cpu_count()
+    chunk_size = max(1, -(-len(frames) // (process_count * 4))) # Several chunks per process to balance the load
+    chunks = [(parameter_sets, start, min(start + chunk_size, len(frames))) for start in range(0, len(frames), chunk_size)]
+
+    with multiprocessing.Pool(process_count, initializer=initialize_sweep_worker, initargs=(frames,)) as pool:
+        chunk_results = pool.starmap(evaluate_frames, chunks)
+
+    lane_offsets = np.concatenate([offsets for offsets, _ in chunk_results], axis=1) if chunk_results else np.empty((len(parameter_sets), 0))
+    durations = np.sum([chunk_durations for _, chunk_durations in chunk_results], axis=0) if chunk_results else np.zeros(len(parameter_sets))
+
+    return [
+        {"parameters": parameters, **summarize_lane_offsets(set_offsets, duration)}
+        for parameters, set_offsets, duration in zip(parameter_sets, lane_offsets, durations)
+    ]
+
+# Formats the results as a table, best detection rate first, then most stable offsets; only swept parameters are shown
+def format_sweep_results(results):
+    swept_names = [name for name in DEFAULT_PARAMETERS if len({json.dumps(result["parameters"][name]) for result in results}) > 1]
+    ranked_results = sorted(
+        results,
+        key=lambda result: (-result["detection_rate"], np.inf if result["offset_jitter"] is None else result["offset_jitter"])
+    )
+
+    lines = [f"{'detected':>8} {'jitter':>7} {'cost ms':>8}  " + "  ".join(swept_names)]
+    for result in ranked_results:
+        jitter = "-" if result["offset_jitter"] is None else f"{result['offset_jitter']:.2f}"
+        values = "  ".join(json.dumps(result["parameters"][name]) for name in swept_names)
+        lines.append(f"{result['detection_rate']:>8.1%} {jitter:>7} {result['frame_cost_ms']:>8.2f}  {values}")
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run lane detection over recorded frames for every combination of a parameter grid")
+    parser.add_argument("recording", help="Video file, or directory of images and .npz frame files")
+    parser.add_argument("grid", help=f"JSON file mapping parameter names to lists of values: {', '.join(DEFAULT_PARAMETERS)}")
+    parser.add_argument("--processes", type=int, help="Worker processes (defaults to the number of cores)")
+    parser.add_argument("--max-frames", type=int, help="Use only the first frames of the recording")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    parameter_sets = load_parameter_grid(args.grid)
+    results = run_sweep(load_frames(args.recording), parameter_sets, args.processes, args.max_frames)
+    print(format_sweep_results(results))
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+import cv2
+import numpy as np
+
+from config import (
+    DEBUG,
+    LANE_TRACKING_SEARCH_MARGIN,
+    LANE_TRACKING_MIN_COVERAGE,
+    LANE_TRACKING_SMOOTHING,
+    LANE_TRACKING_MAX_MISSED_FRAMES,
+    LANE_TRACKING_ROW_STEP
+)
+from lane_detection import (
+    extract_lane_lines_mask,
+    find_c_line_points,
+    fit_c_line,
+    compute_lane_offset,
+    publish_predicted_lane_lines
+)
+from lane_geometry import get_lane_geometry
+from lane_model import evaluate_fit
+from stage_timer import stage_timer
+from utils import buffer_pool
+
+# Detects lanes frame to frame, searching around the previous center line fit while it is reliable
+class LaneTracker:
+    """
+    While tracking, only a band of SEARCH_MARGIN pixels around the expected left, center and right lines
+    is read on every ROW_STEP-th row. Line pixels in the band are shifted onto the center line, and the
+    center line is fitted to their mean x on each row.
+    The full contour and sliding window search runs only when no fit is being tracked or the band
+    covers too few rows. Fits are smoothed with an exponential filter, and the last fit is reused
+    for a few frames when a frame yields none. The fit is kept in the full-scale view, and the margin
+    and row step are scaled with the lane geometry, so tracking carries over when the scale changes.
+    """
+
+    def __init__(
+        self,
+        search_margin=LANE_TRACKING_SEARCH_MARGIN,
+        min_coverage=LANE_TRACKING_MIN_COVERAGE,
+        smoothing=LANE_TRACKING_SMOOTHING,
+        max_missed_frames=LANE_TRACKING_MAX_MISSED_FRAMES,
+        row_step=LANE_TRACKING_ROW_STEP
+    ):
+        self.search_margin = search_margin
+        self.min_coverage = min_coverage
+        self.smoothing = smoothing
+        self.max_missed_frames = max_missed_frames
+        self.row_step = row_step
+        self.reset()
+
+    def reset(self):
+        self.c_line_fit = None
+        self.missed_frames = 0
+
+    # Returns center line points (one per sampled row, as mean x, in the full-scale view) found near the tracked fit,
+    # their weights (the number of lines found on each row) and the fraction of sampled rows they cover
+    def search_around_fit(self, lane_lines_mask, geometry):
+        height, width = lane_lines_mask.shape
+        search_margin = max(1, round(self.search_margin * geometry.scale))
+        row_step = max(1, round(self.row_step * geometry.scale))
+        first_row = row_step // 2
+        rows = np.arange(first_row, height, row_step)
+        window_width = 2 * search_margin + 1
+
+        # Copy the sampled rows into a zero-padded buffer, ignoring the background that fills the parts of the
+        # warped frame outside the camera's view. Windows that leave the frame then read zeros.
+        padding = window_width
+        sampled_rows = buffer_pool.get("lane_tracking_rows", (len(rows), width + 2 * padding))
+        sampled_rows[:, :padding] = 0
+        sampled_rows[:, -padding:] = 0
+        cv2.bitwise_and(
+            lane_lines_mask[first_row::row_step], geometry.get_coverage_mask()[first_row::row_step],
+            dst=sampled_rows[:, padding:-padding]
+        )
+
+        # Columns of the band around each expected line (left, center, right) on every sampled row
+        line_offsets = np.array([-geometry.lane_width, 0, geometry.lane_width])
+        expected_x = np.round(evaluate_fit(geometry.to_scaled_fit(self.c_line_fit), rows)).astype(np.int64)[:, None] + line_offsets
+        np.clip(expected_x, -search_margin - 1, width + search_margin, out=expected_x)
+        columns = buffer_pool.get("lane_tracking_columns", expected_x.shape + (window_width,), np.int64)
+        np.add(expected_x[:, :, None], np.arange(padding - search_margin, padding + search_margin + 1), out=columns)
+        is_line_pixel = sampled_rows[np.arange(len(rows))[:, None, None], columns] > 0
+
+        # Shift the pixels of each line onto the center line and reduce them to one point per row
+        line_counts = np.count_nonzero(is_line_pixel, axis=2)
+        row_counts = line_counts.sum(axis=1)
+        row_x_sums = np.sum(columns, axis=(1, 2), where=is_line_pixel) - (line_counts * (line_offsets + padding)).sum(axis=1)
+        is_row_found = row_counts > 0
+        c_line_points = np.column_stack((row_x_sums[is_row_found] / row_counts[is_row_found], rows[is_row_found]))
+
+        # Rows where more of the three lines are found give more reliable points
+        weights = np.count_nonzero(line_counts[is_row_found], axis=1)
+        return geometry.to_full_scale_points(c_line_points), weights, np.count_nonzero(is_row_found) / len(rows)
+
+    # Detects lanes in an image and returns the smoothed center line fit and lane offset, like detect_lanes
+    def __call__(self, image, result_queue=None):
+        geometry = get_lane_geometry()
+        lane_lines_mask = extract_lane_lines_mask(image, geometry)
+        c_line_points = []
+        weights = None
+
+        if self.c_line_fit is not None:
+            with stage_timer.time("lane_tracking"):
+                tracked_points, tracked_weights, coverage = self.search_around_fit(lane_lines_mask, geometry)
+            if coverage >= self.min_coverage:
+                c_line_points, weights = tracked_points, tracked_weights
+
+        if len(c_line_points) == 0:
+            # Tracking lost or not confident, fall back to the full search
+            c_line_points = find_c_line_points(lane_lines_mask, geometry)
+
+        if len(c_line_points):
+            c_line_fit = fit_c_line(c_line_points, weights)
+            if self.c_line_fit is not None:
+                c_line_fit = self.smoothing * c_line_fit + (1 - self.smoothing) * self.c_line_fit
+            self.c_line_fit = c_line_fit
+            self.missed_frames = 0
+        elif self.c_line_fit is not None and self.missed_frames < self.max_missed_frames:
+            # Reuse the last fit so a single bad frame does not cost a control cycle
+            self.missed_frames += 1
+        else:
+            self.reset()
+
+        if (DEBUG):
+            publish_predicted_lane_lines(lane_lines_mask, self.c_line_fit)
+
+        result = (None, None) if self.c_line_fit is None else (self.c_line_fit, compute_lane_offset(self.c_line_fit))
+        if result_queue is not None:
+            result_queue.put(result)
+        return result
@@ -0,0 +1,87 @@
+from config import (
+    PERCEPTION_FRAME_BUDGET,
+    LOAD_GOVERNOR_SMOOTHING,
+    LOAD_GOVERNOR_DEGRADE_FRAMES,
+    LOAD_GOVERNOR_RECOVER_FRAMES,
+    LOAD_GOVERNOR_RECOVERY_HEADROOM,
+    DEGRADATION_LEVELS
+)
+
+# Quality settings read by the perception stages on every frame; each process has its own copy
+class PerceptionSettings:
+    def __init__(self):
+        self.level = 0
+        self.apply_level(0)
+
+    def apply_level(self, level):
+        self.level = level
+        for name, value in DEGRADATION_LEVELS[level].items():
+            if name != "name":
+                setattr(self, name, value)
+
+perception_settings = PerceptionSettings()
+
+# Sets the degradation level used by the perception stages in this process
+def apply_degradation_level(level):
+    if level != perception_settings.level:
+        perception_settings.apply_level(level)
+
+# Steps through the degradation levels to keep the smoothed perception latency within a per-frame budget
+class LoadGovernor:
+    """
+    Sheds one level of quality after degrade_frames consecutive frames over budget, and restores one level
+    after recover_frames consecutive frames below recovery_headroom times the budget. The counts restart
+    after every change, so each level gets time to take effect before the next one. Level changes are logged.
+    """
+
+    def __init__(
+        self,
+        budget=PERCEPTION_FRAME_BUDGET,
+        smoothing=LOAD_GOVERNOR_SMOOTHING,
+        degrade_frames=LOAD_GOVERNOR_DEGRADE_FRAMES,
+        recover_frames=LOAD_GOVERNOR_RECOVER_FRAMES,
+        recovery_headroom=LOAD_GOVERNOR_RECOVERY_HEADROOM,
+        levels=DEGRADATION_LEVELS
+    ):
+        self.budget = budget
+        self.smoothing = smoothing
+        self.degrade_frames = degrade_frames
+        self.recover_frames = recover_frames
+        self.recovery_headroom = recovery_headroom
+        self.levels = levels
+        self.level = 0
+        self.latency = None
+        self.over_budget_frames = 0
+        self.headroom_frames = 0
+
+    # Takes the latency of a frame in seconds and returns the degradation level for the next frame
+    def update(self, frame_latency):
+        if self.latency is None:
+            self.latency = frame_latency
+        else:
+            self.latency = self.smoothing * frame_latency + (1 - self.smoothing) * self.latency
+
+        if self.latency > self.budget:
+            self.over_budget_frames += 1
+            self.headroom_frames = 0
+        elif self.latency < self.recovery_headroom * self.budget:
+            self.headroom_frames += 1
+            self.over_budget_frames = 0
+        else:
+            self.over_budget_frames = 0
+            self.headroom_frames = 0
+
+        if self.over_budget_frames >= self.degrade_frames and self.level < len(self.levels) - 1:
+            self.set_level(self.level + 1)
+        elif self.headroom_frames >= self.recover_frames and self.level > 0:
+            self.set_level(self.level - 1)
+        return self.level
+
+    def set_level(self, level):
+        print(
+            f"Load governor: {self.levels[self.level]['name']} -> {self.levels[level]['name']} "
+            f"(perception latency {self.latency * 1000:.0f} ms, budget {self.budget * 1000:.0f} ms)"
+        )
+        self.level = level
+        self.over_budget_frames = 0
+        self.headroom_frames = 0
@@ -1,43 +1,58 @@
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 from config import (
-    DEBUG,
-    BASE_MOTOR_SPEED,
-    DESIRED_LANE_OFFSET,
-    DESIRED_MIO_DISTANCE
+    CAMERA_LORES_STREAM,
+    TELEMETRY_ENABLED,
+    TELEMETRY_CAPACITY,
+    TELEMETRY_DUMP_PATH
 )
-from camera_control import initialize_camera, capture_image
-from motor_control import initialize_motors, set_motor_speeds
-from pid import PIDController 
-from drive_assist import get_lane_offset_and_mio_distance
+from camera_control import initialize_camera, CameraStream
+from cpu_plan import apply_cpu_settings, get_role_cpu_settings
+from motor_control import initialize_motors
+from control_loop import initialize_pid_controllers, PerceptionThread, ControlLoop
+from drive_assist import get_perception_engine, wait_for_perception_ready, shutdown_perception_engine
+from stage_timer import stage_timer
+from telemetry import TelemetryRing
 
 def main():
-    # Set up camera, motors, and PID controllers
-    camera = initialize_camera()
-    motor_l, motor_r = initialize_motors()
-    pid_lane = PIDController(kp=3.5, ki=0.0005, kd=1.2)
-    pid_mio = PIDController(kp=4.0, ki=0.0002, kd=1.5)
-
-    while True:
-        image = capture_image(camera)
-        lane_offset, mio_distance = get_lane_offset_and_mio_distance(image)
-
-        if lane_offset is None:
-            # No lanes detected
-            continue
-
-        # Adjust motor speeds based on lane offset and distance to MIO
-        pid_lane_control = pid_lane.compute(DESIRED_LANE_OFFSET, lane_offset)
-        pid_mio_control = pid_mio.compute(DESIRED_MIO_DISTANCE, mio_distance)
-        motor_l_speed = BASE_MOTOR_SPEED - pid_lane_control - pid_mio_control
-        motor_r_speed = BASE_MOTOR_SPEED + pid_lane_control - pid_mio_control
-
-        motor_l_pwm, motor_r_pwm = set_motor_speeds(motor_l, motor_l_speed, motor_r, motor_r_speed)
-
-        if DEBUG:
-            print(f"Motor PWMs - Left: {motor_l_pwm:.2f}, Right: {motor_r_pwm:.2f}")
-
-        time.sleep(0.1)
+    start_time = time.perf_counter()
+    # Pin the main process before it starts any threads; the perception workers pin themselves
+    apply_cpu_settings(get_role_cpu_settings("main"))
+
+    telemetry = None
+    if TELEMETRY_ENABLED:
+        # Enable stage timing before the perception workers start so they time their stages too
+        stage_timer.enable()
+        telemetry = TelemetryRing(TELEMETRY_CAPACITY)
+        telemetry.enable_dumps(TELEMETRY_DUMP_PATH)
+
+    # Start the perception workers, which load and warm up their models while the camera and motors are set up
+    get_perception_engine()
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        camera_future = executor.submit(initialize_camera, lores=CAMERA_LORES_STREAM)
+        motors_future = executor.submit(initialize_motors)
+        camera = camera_future.result()
+        motor_l, motor_r = motors_future.result()
+
+    camera_stream = CameraStream(camera, lores=CAMERA_LORES_STREAM).start()
+    pid_lane, pid_mio = initialize_pid_controllers()
+    perception_thread = None
+
+    try:
+        # The motors are only driven once perception is ready
+        wait_for_perception_ready()
+        print(f"Ready in {time.perf_counter() - start_time:.2f} s")
+
+        # Run perception on the newest frames in the background and control the motors at a fixed rate
+        perception_thread = PerceptionThread(camera_stream).start()
+        control_loop = ControlLoop(motor_l, motor_r, pid_lane, pid_mio, telemetry, start_time=start_time)
+        control_loop.run(perception_thread)
+    finally:
+        if perception_thread is not None:
+            perception_thread.stop()
+        camera_stream.stop()
+        shutdown_perception_engine()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,109 @@
+import json
+import os
+import platform
+import re
+
+from config import (
+    OBJECT_DETECTION_BACKEND,
+    OBJECT_DETECTION_MODEL_VARIANTS,
+    OBJECT_DETECTION_REFERENCE_VARIANT,
+    OBJECT_DETECTION_MODEL_VARIANT,
+    OBJECT_DETECTION_MIN_AGREEMENT,
+    OBJECT_DETECTION_LATENCY_BUDGET,
+    OBJECT_DETECTION_PROFILE_PATH
+)
+
+# Returns the configured model variant with the given name
+def get_model_variant(name):
+    for variant in OBJECT_DETECTION_MODEL_VARIANTS:
+        if variant["name"] == name:
+            return variant
+    raise ValueError(f"Unknown model variant {name!r}; choose from {', '.join(variant['name'] for variant in OBJECT_DETECTION_MODEL_VARIANTS)}")
+
+# Returns the input size an ultralytics export was made for, from the imgsz in its metadata.yaml, or None if it has none
+def get_exported_input_size(model_path):
+    metadata_path = os.path.join(model_path, "metadata.yaml")
+    if not os.path.isfile(metadata_path):
+        return None
+
+    with open(metadata_path) as file:
+        lines = file.read().splitlines()
+
+    # imgsz is written either inline ("imgsz: [640, 640]") or as a block list ("imgsz:" followed by "- 640" lines)
+    for index, line in enumerate(lines):
+        if line.startswith("imgsz:"):
+            value = line[len("imgsz:"):]
+            for item in lines[index + 1:]:
+                if not item.strip().startswith("-"):
+                    break
+                value += item
+
+            sizes = [int(size) for size in re.findall(r"\d+", value)]
+            return max(sizes) if sizes else None
+    return None
+
+# Whether a variant's model files exist and were exported at its input size. An exported NCNN model only runs at
+# the input size it was exported with; other backends load from the path as is, and are checked if it has metadata.
+def is_model_variant_available(variant):
+    exported_input_size = get_exported_input_size(variant["path"]) if os.path.isdir(variant["path"]) else None
+    if OBJECT_DETECTION_BACKEND != "ncnn":
+        return os.path.exists(variant["path"]) and exported_input_size in (None, variant["input_size"])
+
+    return (
+        all(os.path.exists(os.path.join(variant["path"], file_name)) for file_name in ("model.ncnn.param", "model.ncnn.bin"))
+        and exported_input_size == variant["input_size"]
+    )
+
+# Identifies the hardware a profile was measured on, since latencies do not carry over to other machines
+def get_hardware_id():
+    cpu_model = platform.processor()
+    if os.path.exists("/proc/cpuinfo"):
+        with open("/proc/cpuinfo") as file:
+            for line in file:
+                key, _, value = line.partition(":")
+                if key.strip() in ("Model", "model name"):
+                    cpu_model = value.strip()
+                    break
+    return f"{platform.machine()}, {os.cpu_count()} cores, {cpu_model}"
+
+def load_variant_profile(path=OBJECT_DETECTION_PROFILE_PATH):
+    if not os.path.exists(path):
+        return None
+    with open(path) as file:
+        return json.load(file)
+
+def save_variant_profile(profile, path=OBJECT_DETECTION_PROFILE_PATH):
+    with open(path, "w") as file:
+        json.dump(profile, file, indent=2)
+
+# Returns the name of the fastest profiled variant that meets the agreement floor and latency budget, or None
+def select_profiled_variant(profile, min_agreement=OBJECT_DETECTION_MIN_AGREEMENT, latency_budget=OBJECT_DETECTION_LATENCY_BUDGET):
+    configured_names = {variant["name"] for variant in OBJECT_DETECTION_MODEL_VARIANTS}
+    candidates = [
+        (results["latency_p90_ms"], name) for name, results in profile["variants"].items()
+        if name in configured_names and results["agreement"] >= min_agreement and results["latency_p90_ms"] <= latency_budget * 1000
+    ]
+    return min(candidates)[1] if candidates else None
+
+# Returns the model variant to run: the configured one, or with "auto", the fastest variant within the limits
+# according to this machine's profile. Falls back to the reference variant if there is no usable profile.
+def resolve_model_variant(name=OBJECT_DETECTION_MODEL_VARIANT):
+    if name != "auto":
+        return get_model_variant(name)
+
+    profile = load_variant_profile()
+    if profile is None:
+        print(f"No model variant profile, using {OBJECT_DETECTION_REFERENCE_VARIANT} (run src/profile_models.py to profile the variants)")
+        return get_model_variant(OBJECT_DETECTION_REFERENCE_VARIANT)
+    if profile["hardware"] != get_hardware_id():
+        print(f"Model variant profile is from other hardware ({profile['hardware']}), using {OBJECT_DETECTION_REFERENCE_VARIANT}")
+        return get_model_variant(OBJECT_DETECTION_REFERENCE_VARIANT)
+
+    selected_name = select_profiled_variant(profile)
+    if selected_name is None or not is_model_variant_available(get_model_variant(selected_name)):
+        print(f"No profiled model variant is within the limits, using {OBJECT_DETECTION_REFERENCE_VARIANT}")
+        return get_model_variant(OBJECT_DETECTION_REFERENCE_VARIANT)
+
+    results = profile["variants"][selected_name]
+    print(f"Selected model variant {selected_name} ({results['latency_p90_ms']:.1f} ms p90, {results['agreement']:.1%} agreement)")
+    return get_model_variant(selected_name)
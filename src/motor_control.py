@@ -1,13 +1,24 @@
-from gpiozero import Motor
-
 from config import MIN_MOTOR_SPEED, MAX_MOTOR_SPEED
 from utils import clamp_value, map_value
 
 def initialize_motors():
+    from gpiozero import Motor # Only available on the Raspberry Pi
+
     motor_l = Motor(17, 18, pwm=True)
     motor_r = Motor(22, 23, pwm=True)
     return motor_l, motor_r
 
+# Stand-in for gpiozero.Motor that records the commanded speed, for running off the robot
+class FakeMotor:
+    def __init__(self):
+        self.value = 0
+
+    def forward(self, speed=1):
+        self.value = speed
+
+    def stop(self):
+        self.value = 0
+
 def set_motor_speeds(motor_l, motor_l_speed, motor_r, motor_r_speed):
     # Limit motor speeds to config-defined range
     motor_l_speed = clamp_value(motor_l_speed, MIN_MOTOR_SPEED, MAX_MOTOR_SPEED)
@@ -21,3 +32,7 @@ def set_motor_speeds(motor_l, motor_l_speed, motor_r, motor_r_speed):
     motor_r.forward(motor_r_pwm)
 
     return motor_l_pwm, motor_r_pwm
+
+def stop_motors(motor_l, motor_r):
+    motor_l.stop()
+    motor_r.stop()
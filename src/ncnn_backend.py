@@ -0,0 +1,120 @@
+import os
+
+import cv2
+import ncnn
+import numpy as np
+
+from config import (
+    NCNN_INPUT_SIZE,
+    NCNN_NUM_THREADS,
+    NCNN_LIGHTMODE,
+    OBJECT_DETECTION_CONF_THRESHOLD,
+    OBJECT_DETECTION_IOU_THRESHOLD,
+    OBJECT_DETECTION_MAX_DETECTIONS
+)
+
+LETTERBOX_COLOR = (114, 114, 114) # Padding color used by ultralytics
+CLASS_OFFSET = 7680 # Shifts boxes of different classes apart so one NMS pass handles every class separately
+
+# Suppresses boxes that overlap a higher-scoring box by more than the IoU threshold, returning kept indices
+def non_max_suppression(boxes, scores, iou_threshold, max_detections):
+    order = np.argsort(scores)[::-1]
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    kept = []
+
+    while len(order) and len(kept) < max_detections:
+        best, order = order[0], order[1:]
+        kept.append(best)
+
+        top_left = np.maximum(boxes[best, :2], boxes[order, :2])
+        bottom_right = np.minimum(boxes[best, 2:], boxes[order, 2:])
+        intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=1)
+        iou = intersection / (areas[best] + areas[order] - intersection)
+        order = order[iou <= iou_threshold]
+
+    return np.array(kept, dtype=np.int64)
+
+# Runs an ultralytics-exported YOLO NCNN model directly through the ncnn API, without torch.
+# The precision is "fp32" (ncnn's default options), "fp16" (half-precision storage and arithmetic forced on) or "int8"
+# (a model quantized with ncnn2int8).
+class NcnnDetector:
+    def __init__(self, model_path, input_size=NCNN_INPUT_SIZE, num_threads=NCNN_NUM_THREADS, lightmode=NCNN_LIGHTMODE, precision="fp32"):
+        self.input_size = input_size
+        self.net = ncnn.Net()
+        self.net.opt.num_threads = num_threads
+        self.net.opt.lightmode = lightmode
+        self.net.opt.use_vulkan_compute = False
+        # fp32 keeps ncnn's defaults, which already use fp16 storage and packing where the CPU supports them
+        if precision == "fp16":
+            self.net.opt.use_fp16_packed = True
+            self.net.opt.use_fp16_storage = True
+            self.net.opt.use_fp16_arithmetic = True
+        elif precision == "int8":
+            self.net.opt.use_int8_inference = True
+        self.model_path = model_path
+
+        # ncnn reports failures through return codes, and would otherwise run an empty or half-loaded network
+        for load, file_name in ((self.net.load_param, "model.ncnn.param"), (self.net.load_model, "model.ncnn.bin")):
+            file_path = os.path.join(model_path, file_name)
+            if load(file_path) != 0:
+                raise RuntimeError(f"Could not load the ncnn model file {file_path}")
+
+        # Reused letterbox canvas and network input; the ncnn.Mat wraps the NumPy array's memory without copying
+        self.letterbox_frame = np.empty((input_size, input_size, 3), dtype=np.uint8)
+        self.input_array = np.empty((3, input_size, input_size), dtype=np.float32)
+        self.input_mat = ncnn.Mat(self.input_array)
+
+    # Resizes a BGR(A) image into the letterbox canvas and fills the network input, returning the scale and padding
+    def preprocess(self, image):
+        height, width = image.shape[:2]
+        scale = min(self.input_size / height, self.input_size / width)
+        resized_width, resized_height = round(width * scale), round(height * scale)
+        pad_x = round((self.input_size - resized_width) / 2 - 0.1)
+        pad_y = round((self.input_size - resized_height) / 2 - 0.1)
+
+        self.letterbox_frame[:] = LETTERBOX_COLOR
+        content = self.letterbox_frame[pad_y:pad_y + resized_height, pad_x:pad_x + resized_width]
+        if (resized_width, resized_height) == (width, height):
+            np.copyto(content, image[:, :, :3])
+        else:
+            cv2.resize(image[:, :, :3], (resized_width, resized_height), dst=content)
+
+        # BGR HWC bytes to RGB CHW floats in [0, 1]
+        for channel in range(3):
+            np.multiply(self.letterbox_frame[:, :, 2 - channel], 1 / 255, out=self.input_array[channel], casting="unsafe")
+        return scale, pad_x, pad_y
+
+    # Decodes the (4 + classes, anchors) output into [xmin, ymin, xmax, ymax] boxes in image coordinates
+    @staticmethod
+    def postprocess(output, scale, pad_x, pad_y, image_shape):
+        scores = output[4:]
+        is_confident = scores.max(axis=0) > OBJECT_DETECTION_CONF_THRESHOLD
+        if not np.any(is_confident):
+            return np.empty((0, 4))
+
+        # Only decode the few confident anchors
+        confident_scores = scores[:, is_confident]
+        class_ids = np.argmax(confident_scores, axis=0)
+        confidences = confident_scores[class_ids, np.arange(len(class_ids))]
+        center_x, center_y, box_width, box_height = output[:4, is_confident]
+        boxes = np.stack((center_x - box_width / 2, center_y - box_height / 2, center_x + box_width / 2, center_y + box_height / 2), axis=1)
+
+        kept = non_max_suppression(boxes + class_ids[:, None] * CLASS_OFFSET, confidences, OBJECT_DETECTION_IOU_THRESHOLD, OBJECT_DETECTION_MAX_DETECTIONS)
+
+        # Undo the letterbox and clip to the image
+        boxes = (boxes[kept] - (pad_x, pad_y, pad_x, pad_y)) / scale
+        height, width = image_shape[:2]
+        return np.clip(boxes, 0, (width, height, width, height))
+
+    # Detects objects in a BGR(A) image and returns their [xmin, ymin, xmax, ymax] boxes
+    def __call__(self, image):
+        scale, pad_x, pad_y = self.preprocess(image)
+
+        with self.net.create_extractor() as extractor:
+            extractor.input("in0", self.input_mat)
+            result, output = extractor.extract("out0")
+        if result != 0:
+            raise RuntimeError(f"Inference with the ncnn model {self.model_path} failed with error {result}")
+
+        boxes = self.postprocess(np.asarray(output), scale, pad_x, pad_y, image.shape) # A view of the output, not a copy
+        return [[int(xmin), int(ymin), int(xmax), int(ymax)] for xmin, ymin, xmax, ymax in boxes]
@@ -1,84 +1,210 @@
-import cv2
 import numpy as np
-from ultralytics import YOLO
 
 from config import (
     FRAME_WIDTH,
     FRAME_HEIGHT,
+    WARPED_FRAME_WIDTH,
     WARPED_FRAME_HEIGHT,
-    WARPED_LANE_WIDTH
+    WARPED_LANE_WIDTH,
+    OBJECT_DETECTION_BACKEND,
+    NCNN_NUM_THREADS,
+    DEGRADATION_LEVELS
 )
-from utils import warp_perspective
+from cpu_plan import get_process_thread_count
+from lane_model import evaluate_fit
+from load_governor import perception_settings
+from model_variants import get_model_variant, is_model_variant_available, resolve_model_variant
+from stage_timer import stage_timer
+from utils import clip_segments, resize_frame, warp_points, unwarp_points
 
-object_detection_model = YOLO("models/yolo11n_ncnn_model", task="detect")
+object_detection_models = {} # Loaded models, by variant name
+level_variants = {} # Variant run for each object_detection_variant setting of the degradation levels, by that setting
 
-# Detects objects in an image and puts bounding boxes in a multiprocessing queue
-def detect_objects(image, result_queue):
-    image = cv2.resize(image, (FRAME_WIDTH, FRAME_HEIGHT))
+# Loads the model of a variant, importing its backend
+def create_object_detection_model(variant, num_threads=NCNN_NUM_THREADS):
+    if OBJECT_DETECTION_BACKEND == "ncnn":
+        from ncnn_backend import NcnnDetector
+        return NcnnDetector(variant["path"], variant["input_size"], num_threads, precision=variant["precision"])
+
+    from ultralytics import YOLO # Pulls in torch, so only imported when this backend is used
+    return YOLO(variant["path"], task="detect")
+
+# Selects the variant to run at every degradation level and loads their models. A level's smaller variant is only
+# used if it is exported and smaller than the selected variant; otherwise the level keeps the selected one.
+def load_object_detection_models():
+    selected_variant = resolve_model_variant()
+    level_variants[None] = selected_variant
+
+    for level in DEGRADATION_LEVELS:
+        name = level["object_detection_variant"]
+        if name is None or name in level_variants:
+            continue
+
+        variant = get_model_variant(name)
+        if variant["input_size"] >= selected_variant["input_size"]:
+            variant = selected_variant
+        elif not is_model_variant_available(variant):
+            print(f"Model variant {name} of degradation level {level['name']!r} is not exported, using {selected_variant['name']}")
+            variant = selected_variant
+        level_variants[name] = variant
+
+    num_threads = get_process_thread_count("ncnn_threads", NCNN_NUM_THREADS)
+    for variant in level_variants.values():
+        if variant["name"] not in object_detection_models:
+            object_detection_models[variant["name"]] = create_object_detection_model(variant, num_threads)
+            if variant is not selected_variant:
+                # The first inference is slow, and would otherwise land on a frame that is already over budget
+                run_object_detection_model(object_detection_models[variant["name"]], variant, np.zeros((FRAME_HEIGHT, FRAME_WIDTH, 3), dtype=np.uint8))
+
+# Returns the object detection model and variant of the current degradation level, loading the models on first use
+def get_object_detection_model():
+    if not level_variants:
+        load_object_detection_models()
+
+    variant = level_variants[perception_settings.object_detection_variant]
+    return object_detection_models[variant["name"]], variant
+
+# Runs a variant's model on its region of an image and returns [xmin, ymin, xmax, ymax] boxes in image coordinates
+def run_object_detection_model(model, variant, image):
+    roi_x, roi_y = 0, 0
+    if variant["roi"] is not None:
+        roi_x, roi_y, roi_xmax, roi_ymax = variant["roi"]
+        image = image[roi_y:roi_ymax, roi_x:roi_xmax]
+
+    if OBJECT_DETECTION_BACKEND == "ncnn":
+        boxes = model(image)
+    else:
+        results = model(image, imgsz=variant["input_size"], verbose=False)
+        boxes = [[int(value) for value in bbox.tolist()] for bbox in results[0].boxes.xyxy]
+
+    return [[xmin + roi_x, ymin + roi_y, xmax + roi_x, ymax + roi_y] for xmin, ymin, xmax, ymax in boxes]
+
+# Pixels a 3 px thick cv2.line lights around a box's bottom edge, as [extra half-width past the box ends, half-height]
+# rectangles: the edge row reaches 2 px past the ends, the rows 1 px away reach 1 px past them and the rows 2 px away
+# end flush with them. The distance computation used to draw the edge like this and warp the image.
+BOTTOM_EDGE_LIT_PIXELS = np.float32([(2, 0), (1, 1), (0, 2)])
+# Bilinear warping lights every sample less than a pixel away from a lit pixel, except that the remap rounds sample
+# positions to 1/32 px, so samples within the last step of that reach get no weight
+INTERPOLATION_REACH = 1 - 1 / 32
+WARPED_FRAME_CORNERS = np.float32([(0, 0), (WARPED_FRAME_WIDTH, 0), (0, WARPED_FRAME_HEIGHT), (WARPED_FRAME_WIDTH, WARPED_FRAME_HEIGHT)])
+
+# Detects objects in an image and returns their bounding boxes, also putting them in a queue if one is given
+def detect_objects(image, result_queue=None):
+    model, variant = get_object_detection_model() # Loading failures are fatal, unlike inference errors
+    image = resize_frame(image, (FRAME_WIDTH, FRAME_HEIGHT), "object_detection_frame")
     detected_boxes = []
     
     try:
-        results = object_detection_model(image)
-
-        for bbox in results.boxes.xyxy:
-            xmin, ymin, xmax, ymax = bbox.tolist()
-            detected_boxes.append([int(xmin), int(ymin), int(xmax), int(ymax)]) 
+        with stage_timer.time("yolo"):
+            detected_boxes = run_object_detection_model(model, variant, image)
     except Exception as e:
         print(f"Model Inference Error: {str(e)}")
     finally:
-        result_queue.put(detected_boxes)
+        if result_queue is not None:
+            result_queue.put(detected_boxes)
         return detected_boxes
     
-# Computes the distance to a detected in-lane object using its bounding box and the lane center line fit
-def compute_distance_to_object(c_line_fit, xmin, xmax, ymax):
-    """
-    The center line fit (c_line_fit) is defined in the bird's-eye view.
-    To compute the distance from the vehicle to the object, 
-    we need to determine the object's position in this warped perspective.
-    """    
+# Projects the bottom edges of [xmin, ymin, xmax, ymax] boxes to the bird's-eye view and returns the bounding boxes
+# of their footprints there (xmin, exclusive xmax and exclusive ymax) and whether each footprint is visible at all
+def get_warped_bottom_edges(boxes):
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    box_count = len(boxes)
 
-    # Draw the bottom edge of the object on a grayscale frame
-    frame = np.zeros((FRAME_HEIGHT, FRAME_WIDTH), dtype=np.uint8) 
-    cv2.line(frame, (xmin, ymax), (xmax, ymax), 255, 3) 
+    # Build the corners of each rectangle of lit pixels, keep those that overlap the original frame and clip them to
+    # it, then widen them by the interpolation reach to get the footprint
+    corners = np.empty((box_count, len(BOTTOM_EDGE_LIT_PIXELS), 4, 2), dtype=np.float32) # box, rectangle, corner, x/y
+    corners[:, :, 0::2, 0] = (boxes[:, None, 0] - BOTTOM_EDGE_LIT_PIXELS[:, 0])[:, :, None]
+    corners[:, :, 1::2, 0] = (boxes[:, None, 2] + BOTTOM_EDGE_LIT_PIXELS[:, 0])[:, :, None]
+    corners[:, :, :2, 1] = (boxes[:, None, 3] - BOTTOM_EDGE_LIT_PIXELS[:, 1])[:, :, None]
+    corners[:, :, 2:, 1] = (boxes[:, None, 3] + BOTTOM_EDGE_LIT_PIXELS[:, 1])[:, :, None]
+    is_lit = (
+        (corners[:, :, 0, 0] <= FRAME_WIDTH - 1) & (corners[:, :, 3, 0] >= 0) &
+        (corners[:, :, 0, 1] <= FRAME_HEIGHT - 1) & (corners[:, :, 3, 1] >= 0)
+    )
+    np.clip(corners, 0, (FRAME_WIDTH - 1, FRAME_HEIGHT - 1), out=corners)
+    corners[:, :, 0::2, 0] -= INTERPOLATION_REACH
+    corners[:, :, 1::2, 0] += INTERPOLATION_REACH
+    corners[:, :, :2, 1] -= INTERPOLATION_REACH
+    corners[:, :, 2:, 1] += INTERPOLATION_REACH
 
-    # Warp to bird's-eye view and extract contours 
-    warped_frame = warp_perspective(frame, bg_color=0) 
-    contours, _ = cv2.findContours(warped_frame, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    
-    if (len(contours) == 0):
-        # No contours found, assume maximum distance
-        return WARPED_FRAME_HEIGHT
-     
-    # Get bounding box of the warped object contour
-    warped_xmin, warped_ymin, width, height = cv2.boundingRect(contours[0])
-    warped_xmax = warped_xmin + width
-    warped_ymax = warped_ymin + height
-
-    # Determine the lane boundaries at the bottom edge of the warped object
+    # Project all corners to the bird's-eye view at once; points beyond the horizon have no valid projection
+    warped_corners, is_in_front = warp_points(corners.reshape(-1, 2))
+    warped_corners = warped_corners.reshape(corners.shape)
+    is_in_front = (is_in_front.reshape(corners.shape[:3]) | ~is_lit[:, :, None]).reshape(box_count, -1).all(axis=1)
+
+    # Keep the parts of the rectangle sides that land inside the warped frame, and the warped frame corners that
+    # lie inside a rectangle; the bounding box of these points is that of the visible footprint
+    start, end, is_visible = clip_segments(
+        warped_corners[:, :, [0, 1, 3, 2]].reshape(-1, 2),
+        warped_corners[:, :, [1, 3, 2, 0]].reshape(-1, 2),
+        WARPED_FRAME_WIDTH,
+        WARPED_FRAME_HEIGHT
+    )
+    is_visible &= np.repeat(is_lit.reshape(-1), 4)
+    side_points = np.where(is_visible[:, None, None], np.stack([start, end], axis=1), np.nan).reshape(box_count, -1, 2)
+    frame_corners, _ = unwarp_points(WARPED_FRAME_CORNERS)
+    is_frame_corner_inside = (
+        (corners[:, :, :1, 0] < frame_corners[:, 0]) & (frame_corners[:, 0] < corners[:, :, 1:2, 0]) &
+        (corners[:, :, :1, 1] < frame_corners[:, 1]) & (frame_corners[:, 1] < corners[:, :, 2:3, 1]) &
+        is_lit[:, :, None]
+    )
+    frame_corner_points = np.where(is_frame_corner_inside[..., None], WARPED_FRAME_CORNERS, np.nan).reshape(box_count, -1, 2)
+    visible_points = np.concatenate([side_points, frame_corner_points], axis=1)
+    is_object_visible = is_in_front & ~np.isnan(visible_points[:, :, 0]).all(axis=1)
+    visible_points[~is_object_visible] = 0
+
+    # The footprint is open, so the warped pixels it lights are those strictly inside it, or on the frame's edge.
+    # Get their bounding box, with exclusive maximums like cv2.boundingRect; footprints that only touch the frame light none.
+    visible_min = np.nanmin(visible_points, axis=1)
+    visible_max = np.nanmax(visible_points, axis=1)
+    warped_xmin, warped_ymin = np.where(visible_min > 0, np.floor(visible_min) + 1, 0).astype(np.int64).T
+    warped_xmax, warped_ymax = np.minimum(np.ceil(visible_max), (WARPED_FRAME_WIDTH, WARPED_FRAME_HEIGHT)).astype(np.int64).T # Clipped points can land a rounding error outside
+    is_object_visible &= (warped_xmin < warped_xmax) & (warped_ymin < warped_ymax)
+    return warped_xmin, warped_xmax, warped_ymax, is_object_visible
+
+# Returns the distances to objects from the bounding boxes of their warped bottom edges, or the maximum distance for
+# objects outside the lane
+def compute_in_lane_distances(c_line_fit, warped_xmin, warped_xmax, warped_ymax):
+    # Determine the lane boundaries at the bottom edge of each warped object
     decision_eval_y = warped_ymax
     line_margin = 20 # Shrinks lane boundaries for a stricter in-lane check
-    c_line_x = int(np.polyval(c_line_fit, decision_eval_y)) + line_margin # Center lane line position
+    c_line_x = evaluate_fit(c_line_fit, decision_eval_y).astype(np.int64) + line_margin # Center lane line position
     r_line_x = c_line_x + WARPED_LANE_WIDTH - line_margin * 2 # Right lane line position
 
-    is_object_in_lane = c_line_x <= warped_xmin <= r_line_x or c_line_x <= warped_xmax <= r_line_x # Assuming vehicle is in the right-hand lane
-        
-    if (is_object_in_lane):
-        distance = WARPED_FRAME_HEIGHT - warped_ymax
-        return distance
-    else:
-        # Object not in lane, assume maximum distance
-        return WARPED_FRAME_HEIGHT
+    # Assuming vehicle is in the right-hand lane
+    is_object_in_lane = ((c_line_x <= warped_xmin) & (warped_xmin <= r_line_x)) | ((c_line_x <= warped_xmax) & (warped_xmax <= r_line_x))
+
+    return np.where(is_object_in_lane, WARPED_FRAME_HEIGHT - warped_ymax, WARPED_FRAME_HEIGHT)
+
+# Computes the distances to detected objects using their bounding boxes and the lane center line fit
+def compute_distances_to_objects(c_line_fit, boxes):
+    """
+    The center line fit (c_line_fit) is defined in the bird's-eye view.
+    To compute the distance from the vehicle to an object, 
+    we need to determine the object's position in this warped perspective.
+    Only the bottom edge of each box matters, so we project its footprint analytically 
+    instead of warping an image of it. Objects outside the lane are at the maximum distance.
+    """
+
+    if len(boxes) == 0:
+        return np.empty(0, dtype=np.int64)
+    warped_xmin, warped_xmax, warped_ymax, is_object_visible = get_warped_bottom_edges(boxes)
+
+    return np.where(is_object_visible, compute_in_lane_distances(c_line_fit, warped_xmin, warped_xmax, warped_ymax), WARPED_FRAME_HEIGHT)
+
+# Computes the distance to a detected in-lane object using its bounding box and the lane center line fit
+def compute_distance_to_object(c_line_fit, xmin, xmax, ymax):
+    return int(compute_distances_to_objects(c_line_fit, [(xmin, 0, xmax, ymax)])[0])
 
 # Finds the closest in-lane object (MIO) and its distance
 def find_mio(c_line_fit, object_detection_result):
-    mio = None
-    mio_distance = WARPED_FRAME_HEIGHT
+    distances = compute_distances_to_objects(c_line_fit, object_detection_result)
+    if len(distances) == 0:
+        return None, WARPED_FRAME_HEIGHT
 
-    for detection in object_detection_result:
-        xmin, _, xmax, ymax = detection
-        distance = compute_distance_to_object(c_line_fit, xmin, xmax, ymax)
-        if distance < mio_distance:
-            mio_distance = distance
-            mio = detection    
+    mio_index = np.argmin(distances)
+    if distances[mio_index] >= WARPED_FRAME_HEIGHT:
+        # No in-lane objects
+        return None, WARPED_FRAME_HEIGHT
 
-    return mio, mio_distance
+    return object_detection_result[mio_index], int(distances[mio_index])
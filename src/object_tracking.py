@@ -0,0 +1,124 @@
+import numpy as np
+
+from config import (
+    FRAME_WIDTH,
+    FRAME_HEIGHT,
+    OBJECT_TRACKING_IOU_THRESHOLD,
+    OBJECT_TRACKING_VELOCITY_SMOOTHING,
+    OBJECT_TRACKING_CONFIDENCE_DECAY,
+    OBJECT_TRACKING_NEW_TRACK_CONFIDENCE,
+    OBJECT_TRACKING_MIN_CONFIDENCE
+)
+from load_governor import perception_settings
+from object_detection import detect_objects
+
+# Computes the IoU of every box in a against every box in b, both given as (N, 4) [xmin, ymin, xmax, ymax] arrays
+def compute_iou_matrix(a, b):
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+# Tracks bounding boxes between detector runs with IoU association and constant-velocity prediction
+class ObjectTracker:
+    def __init__(
+        self,
+        iou_threshold=OBJECT_TRACKING_IOU_THRESHOLD,
+        velocity_smoothing=OBJECT_TRACKING_VELOCITY_SMOOTHING,
+        confidence_decay=OBJECT_TRACKING_CONFIDENCE_DECAY,
+        new_track_confidence=OBJECT_TRACKING_NEW_TRACK_CONFIDENCE
+    ):
+        self.iou_threshold = iou_threshold
+        self.velocity_smoothing = velocity_smoothing
+        self.confidence_decay = confidence_decay
+        self.new_track_confidence = new_track_confidence
+        self.reset()
+
+    def reset(self):
+        self.boxes = np.empty((0, 4)) # Current (predicted) box of each track
+        self.velocities = np.empty((0, 4)) # Per-frame box motion
+        self.confidences = np.empty(0)
+        self.frames_since_update = 0
+
+    # Lowest confidence among the tracks; with no tracks there is nothing to lose
+    @property
+    def confidence(self):
+        return float(self.confidences.min()) if len(self.confidences) else 1.0
+
+    # Replaces the tracks with fresh detections, estimating velocities for the ones that match a track
+    def update(self, detections):
+        detections = np.asarray(detections, dtype=np.float64).reshape(-1, 4)
+        velocities = np.zeros_like(detections)
+        confidences = np.full(len(detections), self.new_track_confidence)
+
+        if len(detections) and len(self.boxes):
+            # Bring the tracks to the current frame, which is one past the last prediction
+            predicted_boxes = self.boxes + self.velocities
+            elapsed_frames = self.frames_since_update + 1
+
+            # Greedily match detections to tracks in order of decreasing IoU
+            iou = compute_iou_matrix(detections, predicted_boxes)
+            is_detection_matched = np.zeros(len(detections), dtype=bool)
+            is_track_matched = np.zeros(len(predicted_boxes), dtype=bool)
+            for detection_index, track_index in zip(*np.unravel_index(np.argsort(iou, axis=None)[::-1], iou.shape)):
+                if iou[detection_index, track_index] < self.iou_threshold:
+                    break
+                if is_detection_matched[detection_index] or is_track_matched[track_index]:
+                    continue
+                is_detection_matched[detection_index] = True
+                is_track_matched[track_index] = True
+
+                # Correct the velocity by the prediction error spread over the frames since the last update
+                correction = (detections[detection_index] - predicted_boxes[track_index]) / elapsed_frames
+                velocities[detection_index] = self.velocities[track_index] + self.velocity_smoothing * correction
+                confidences[detection_index] = 1.0
+
+        self.boxes = detections
+        self.velocities = velocities
+        self.confidences = confidences
+        self.frames_since_update = 0
+
+    # Advances every track by one frame and returns the predicted boxes
+    def predict(self):
+        self.boxes = self.boxes + self.velocities
+        self.confidences = self.confidences * self.confidence_decay
+        self.frames_since_update += 1
+
+        # Drop tracks that have left the frame
+        is_in_frame = (self.boxes[:, 2] > 0) & (self.boxes[:, 0] < FRAME_WIDTH) & (self.boxes[:, 3] > 0) & (self.boxes[:, 1] < FRAME_HEIGHT)
+        self.boxes = self.boxes[is_in_frame]
+        self.velocities = self.velocities[is_in_frame]
+        self.confidences = self.confidences[is_in_frame]
+        return self.boxes
+
+# Runs the object detector every few frames (as set by the degradation level), or sooner when tracking gets
+# unreliable, and tracks boxes in between
+class TrackedObjectDetector:
+    def __init__(self, detect=detect_objects, min_confidence=OBJECT_TRACKING_MIN_CONFIDENCE):
+        self.detect = detect
+        self.min_confidence = min_confidence
+        self.tracker = ObjectTracker()
+        self.reset()
+
+    def reset(self):
+        self.tracker.reset()
+        self.frames_until_detection = 0
+
+    # Returns bounding boxes like detect_objects, as [xmin, ymin, xmax, ymax] lists
+    def __call__(self, image, result_queue=None):
+        if self.frames_until_detection <= 0 or self.tracker.confidence < self.min_confidence:
+            detected_boxes = self.detect(image)
+            self.tracker.update(detected_boxes)
+            self.frames_until_detection = perception_settings.object_detection_interval - 1
+        else:
+            predicted_boxes = self.tracker.predict()
+            predicted_boxes = np.clip(predicted_boxes, 0, [FRAME_WIDTH, FRAME_HEIGHT, FRAME_WIDTH, FRAME_HEIGHT])
+            detected_boxes = predicted_boxes.astype(int).tolist()
+            self.frames_until_detection -= 1
+
+        if result_queue is not None:
+            result_queue.put(detected_boxes)
+        return detected_boxes
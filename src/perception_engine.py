@@ -0,0 +1,258 @@
+import collections
+import multiprocessing
+import signal
+import warnings
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from config import (
+    FRAME_WIDTH,
+    FRAME_HEIGHT,
+    FRAME_CHANNELS,
+    PERCEPTION_RING_SLOTS,
+    PERCEPTION_RESULT_TIMEOUT,
+    PERCEPTION_WARMUP_FRAMES,
+    PERCEPTION_STARTUP_TIMEOUT
+)
+from cpu_plan import apply_cpu_settings, get_role_cpu_settings
+from debug_view import get_debug_queue, set_debug_queue
+from load_governor import apply_degradation_level
+from stage_timer import stage_timer
+
+READY_FRAME_ID = -1 # Frame id of the message a worker sends once it has warmed up
+
+# Fixed-size ring of frame slots in shared memory, written by the main process and read by the workers
+class SharedFrameRing:
+    def __init__(self, slot_count, slot_size, name=None):
+        self.slot_count = slot_count
+        self.slot_size = slot_size
+        self.is_owner = name is None
+
+        if self.is_owner:
+            self.shared_memory = shared_memory.SharedMemory(create=True, size=slot_size * slot_count)
+        else:
+            self.shared_memory = shared_memory.SharedMemory(name=name)
+
+    @property
+    def name(self):
+        return self.shared_memory.name
+
+    # Returns a NumPy view of an image stored at an offset within a slot, without copying
+    def view(self, slot, offset, shape):
+        return np.ndarray(shape, dtype=np.uint8, buffer=self.shared_memory.buf, offset=slot * self.slot_size + offset)
+
+    # Copies an image to an offset within a slot, resizing it to the given size if needed, and returns its shape
+    def write(self, slot, offset, image, size=None):
+        width, height = size if size is not None else (image.shape[1], image.shape[0])
+        shape = (height, width) + image.shape[2:]
+        if offset + np.prod(shape) > self.slot_size:
+            raise ValueError(f"Image with shape {image.shape} does not fit in a {self.slot_size} byte ring slot")
+
+        slot_image = self.view(slot, offset, shape)
+        if image.shape == shape:
+            np.copyto(slot_image, image)
+        else:
+            cv2.resize(image, (width, height), dst=slot_image)
+        return shape
+
+    def close(self):
+        self.shared_memory.close()
+        if self.is_owner:
+            self.shared_memory.unlink()
+
+# Runs a stage on dummy frames so lazy imports, model loading and first-inference costs are paid before real frames arrive
+def warm_up_stage(stage, frame_count=PERCEPTION_WARMUP_FRAMES):
+    dummy_frame = np.zeros((FRAME_HEIGHT, FRAME_WIDTH, FRAME_CHANNELS), dtype=np.uint8)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore") # Fits to a blank frame are meaningless and may warn
+        for _ in range(frame_count):
+            stage(dummy_frame)
+
+    # Forget anything a stateful stage learned from the dummy frames
+    if hasattr(stage, "reset"):
+        stage.reset()
+    stage_timer.drain()
+
+# Runs a perception stage on every frame slot sent by the engine until it receives a shutdown message.
+# The worker warms the stage up and reports ready first. Stage timings recorded while processing a frame are sent back with its result.
+# Debug images the stage publishes go to debug_queue, if given. The worker pins itself and limits its threads as given by cpu_settings.
+def run_perception_worker(stage, ring_name, slot_count, slot_size, connection, is_timing_enabled=False, debug_queue=None, cpu_settings=None):
+    # Ctrl+C is handled by the main process, which shuts the workers down in order
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if cpu_settings is not None:
+        apply_cpu_settings(cpu_settings)
+    stage_timer.enable(is_timing_enabled, keep_samples=True) # Samples are drained and sent back after every frame
+    set_debug_queue(None) # Set after warm-up, so the dummy frames are not shown
+    ring = SharedFrameRing(slot_count, slot_size, name=ring_name)
+
+    try:
+        try:
+            warm_up_stage(stage)
+            set_debug_queue(debug_queue)
+            connection.send((READY_FRAME_ID, None, None, {}))
+        except Exception as e:
+            connection.send((READY_FRAME_ID, None, f"{type(e).__name__}: {e}", {}))
+            return
+
+        while True:
+            task = connection.recv()
+            if task is None:
+                break
+
+            frame_id, slot, offset, shape, degradation_level = task
+            apply_degradation_level(degradation_level)
+            try:
+                result = stage(ring.view(slot, offset, shape))
+                connection.send((frame_id, result, None, stage_timer.drain()))
+            except Exception as e:
+                connection.send((frame_id, None, f"{type(e).__name__}: {e}", stage_timer.drain()))
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        ring.close()
+        connection.close()
+
+class PerceptionWorker:
+    def __init__(self, name, stage, ring, cpu_settings=None):
+        self.name = name
+        self.connection, worker_connection = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=run_perception_worker,
+            args=(stage, ring.name, ring.slot_count, ring.slot_size, worker_connection, stage_timer.is_enabled, get_debug_queue(), cpu_settings),
+            name=f"{name}-worker",
+            daemon=True
+        )
+        self.process.start()
+        worker_connection.close()
+
+    def send(self, task):
+        self.connection.send(task)
+
+    # Waits for the result of a frame, failing fast if the worker dies or stops responding
+    def receive(self, frame_id, timeout=PERCEPTION_RESULT_TIMEOUT):
+        if not self.connection.poll(timeout):
+            state = "exited" if not self.process.is_alive() else "timed out"
+            raise RuntimeError(f"{self.name} worker {state} while processing frame {frame_id}")
+
+        result_frame_id, result, error, stage_samples = self.connection.recv()
+        stage_timer.merge(stage_samples)
+        if result_frame_id != frame_id:
+            raise RuntimeError(f"{self.name} worker returned frame {result_frame_id}, expected {frame_id}")
+        if error is not None:
+            raise RuntimeError(f"{self.name} worker failed on frame {frame_id}: {error}")
+        return result
+
+    def stop(self, timeout):
+        try:
+            self.connection.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.connection.close()
+
+# Long-lived lane and object detection workers fed through a shared-memory frame ring
+class PerceptionEngine:
+    """
+    Each worker process is started once, so per-frame cost is a copy into the ring and two small pipe messages.
+    The workers load and warm up their stages in the background; wait_until_ready blocks until both have,
+    and the first submit waits for it if it has not been called.
+    Frames are submitted in order and their results collected in the same order; up to `slot_count` frames
+    can be in flight, which lets a caller overlap capturing the next frame with processing the current one.
+    Each slot holds a frame and, optionally, a separate single-channel image (e.g. lores luma) for lane detection.
+    Every task carries the current degradation level, which the workers apply before processing the frame.
+    The workers are placed on cores according to the "lane" and "object" roles of the current CPU plan.
+    """
+
+    def __init__(self, lane_stage, object_stage, slot_count=PERCEPTION_RING_SLOTS):
+        self.lane_image_offset = FRAME_HEIGHT * FRAME_WIDTH * FRAME_CHANNELS
+        self.ring = SharedFrameRing(slot_count, self.lane_image_offset + FRAME_HEIGHT * FRAME_WIDTH)
+        self.workers = []
+        self.in_flight = collections.deque()
+        self.next_frame_id = 0
+        self.is_ready = False
+        self.degradation_level = 0
+
+        try:
+            self.lane_worker = PerceptionWorker("lane-detection", lane_stage, self.ring, get_role_cpu_settings("lane"))
+            self.workers.append(self.lane_worker)
+            self.object_worker = PerceptionWorker("object-detection", object_stage, self.ring, get_role_cpu_settings("object"))
+            self.workers.append(self.object_worker)
+        except Exception:
+            self.close()
+            raise
+
+    # Waits until every worker has warmed up, raising if one fails or does not finish in time
+    def wait_until_ready(self, timeout=PERCEPTION_STARTUP_TIMEOUT):
+        if not self.is_ready:
+            for worker in self.workers:
+                worker.receive(READY_FRAME_ID, timeout)
+            self.is_ready = True
+
+    # Queues an image for lane and object detection and returns its frame id.
+    # Lane detection runs on lane_image instead if one is given.
+    def submit(self, image, lane_image=None):
+        self.wait_until_ready()
+        if len(self.in_flight) == self.ring.slot_count:
+            raise RuntimeError("Perception ring is full; collect results before submitting more frames")
+
+        frame_id = self.next_frame_id
+        slot = frame_id % self.ring.slot_count
+        shape = self.ring.write(slot, 0, image, (FRAME_WIDTH, FRAME_HEIGHT))
+        self.object_worker.send((frame_id, slot, 0, shape, self.degradation_level))
+
+        if lane_image is None:
+            self.lane_worker.send((frame_id, slot, 0, shape, self.degradation_level))
+        else:
+            lane_image_shape = self.ring.write(slot, self.lane_image_offset, lane_image)
+            self.lane_worker.send((frame_id, slot, self.lane_image_offset, lane_image_shape, self.degradation_level))
+
+        self.in_flight.append(frame_id)
+        self.next_frame_id += 1
+        return frame_id
+
+    # Returns the lane and object detection results of the oldest submitted frame
+    def collect(self):
+        frame_id = self.in_flight.popleft()
+
+        # Read both results before raising, so a failed stage does not leave the other worker's result in its pipe
+        # to be mistaken for the next frame's
+        results = []
+        errors = []
+        for worker in (self.lane_worker, self.object_worker):
+            try:
+                results.append(worker.receive(frame_id))
+            except RuntimeError as e:
+                results.append(None)
+                errors.append(e)
+
+        if errors:
+            raise errors[0]
+        lane_detection_result, object_detection_result = results
+        return lane_detection_result, object_detection_result
+
+    def process(self, image, lane_image=None):
+        self.submit(image, lane_image)
+        return self.collect()
+
+    # Stops the workers and releases the shared memory; safe to call more than once
+    def close(self, timeout=2.0):
+        for worker in self.workers:
+            worker.stop(timeout)
+        self.workers = []
+        self.in_flight.clear()
+
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
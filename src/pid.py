@@ -1,15 +1,47 @@
+from config import PID_REFERENCE_DT
+from utils import clamp_value
+
 class PIDController:
-    def __init__(self, kp, ki, kd):
+    """
+    The gains are tuned per control step of reference_dt seconds. When compute is given the measured dt,
+    the integral and derivative are scaled to it so the same gains hold at any loop rate.
+    The integral term is clamped to +/- integral_limit (anti-windup), and the derivative can be smoothed
+    with a first-order low-pass filter of derivative_time_constant seconds.
+    """
+
+    def __init__(self, kp, ki, kd, integral_limit=None, derivative_time_constant=0.0, reference_dt=PID_REFERENCE_DT):
         self.kp = kp
         self.ki = ki
         self.kd = kd
+        self.integral_limit = integral_limit
+        self.derivative_time_constant = derivative_time_constant
+        self.reference_dt = reference_dt
+        self.reset()
+
+    def reset(self):
         self.previous_error = 0
         self.integral = 0
+        self.derivative = 0
+        self.terms = (0, 0, 0) # Proportional, integral and derivative terms of the last output
+
+    # Returns the control output; dt is the time since the previous call (None assumes one reference step)
+    def compute(self, setpoint, actual, dt=None):
+        dt = self.reference_dt if dt is None or dt <= 0 else dt
+        steps = dt / self.reference_dt
 
-    def compute(self, setpoint, actual):
         error = setpoint - actual
-        self.integral += error
-        derivative = error - self.previous_error
+        self.integral += error * steps
+        if self.integral_limit is not None and self.ki:
+            integral_bound = self.integral_limit / abs(self.ki)
+            self.integral = clamp_value(self.integral, -integral_bound, integral_bound)
+
+        derivative = (error - self.previous_error) / steps
+        if self.derivative_time_constant:
+            smoothing = dt / (self.derivative_time_constant + dt)
+            derivative = self.derivative + smoothing * (derivative - self.derivative)
+        self.derivative = derivative
         self.previous_error = error
-        output = self.kp * error + self.ki * self.integral + self.kd * derivative
-        return output  
\ No newline at end of file
+
+        self.terms = (self.kp * error, self.ki * self.integral, self.kd * derivative)
+        output = sum(self.terms)
+        return output
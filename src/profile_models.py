@@ -0,0 +1,138 @@
+import argparse
+import itertools
+import time
+
+import cv2
+import numpy as np
+
+from config import (
+    FRAME_WIDTH,
+    FRAME_HEIGHT,
+    NCNN_NUM_THREADS,
+    OBJECT_DETECTION_MODEL_VARIANTS,
+    OBJECT_DETECTION_REFERENCE_VARIANT,
+    OBJECT_DETECTION_MIN_AGREEMENT,
+    OBJECT_DETECTION_LATENCY_BUDGET,
+    OBJECT_DETECTION_MIN_REFERENCE_BOXES,
+    OBJECT_DETECTION_PROFILE_PATH
+)
+from cpu_plan import apply_cpu_settings, get_role_cpu_settings, get_process_thread_count
+from model_variants import (
+    get_model_variant,
+    is_model_variant_available,
+    get_hardware_id,
+    save_variant_profile,
+    select_profiled_variant
+)
+from object_detection import create_object_detection_model, run_object_detection_model
+from object_tracking import compute_iou_matrix
+from replay import load_frames
+
+MATCH_IOU_THRESHOLD = 0.5 # Least IoU for a box to count as the same detection as a reference box
+WARMUP_FRAMES = 3
+
+# Counts the boxes of two detections that match one to one, pairing the most overlapping boxes first
+def count_matching_boxes(boxes, reference_boxes, iou_threshold=MATCH_IOU_THRESHOLD):
+    if len(boxes) == 0 or len(reference_boxes) == 0:
+        return 0
+
+    ious = compute_iou_matrix(np.asarray(boxes, dtype=np.float64), np.asarray(reference_boxes, dtype=np.float64))
+
+    match_count = 0
+    while ious.size and ious.max() >= iou_threshold:
+        row, column = np.unravel_index(np.argmax(ious), ious.shape)
+        ious[row, :] = 0
+        ious[:, column] = 0
+        match_count += 1
+    return match_count
+
+# Runs a variant on every frame and returns its per-frame latencies in seconds and its boxes
+def run_model_variant(variant, frames, num_threads):
+    model = create_object_detection_model(variant, num_threads)
+    for frame in frames[:WARMUP_FRAMES]:
+        run_object_detection_model(model, variant, frame)
+
+    latencies = []
+    detections = []
+    for frame in frames:
+        start_time = time.perf_counter()
+        detections.append(run_object_detection_model(model, variant, frame))
+        latencies.append(time.perf_counter() - start_time)
+    return np.array(latencies), detections
+
+# Profiles every available model variant on recorded frames against the reference variant
+def profile_model_variants(frames, variant_names=None, max_frames=None):
+    """
+    Frames are resized to the camera frame size, as in the pipeline. Agreement is the F1 score of a variant's
+    boxes against the reference's boxes over all frames, so the reference must detect at least
+    OBJECT_DETECTION_MIN_REFERENCE_BOXES boxes for it to mean anything. Variants that fail to load or run are
+    skipped. Runs with the threads and cores of the "object" role in the current CPU plan, so latencies match the
+    object detection worker's.
+    """
+
+    frames = [cv2.resize(frame, (FRAME_WIDTH, FRAME_HEIGHT)) for frame in itertools.islice(frames, max_frames)]
+    apply_cpu_settings(get_role_cpu_settings("object"))
+    num_threads = get_process_thread_count("ncnn_threads", NCNN_NUM_THREADS)
+
+    reference_variant = get_model_variant(OBJECT_DETECTION_REFERENCE_VARIANT)
+    if not is_model_variant_available(reference_variant):
+        raise FileNotFoundError(f"Reference model variant {reference_variant['name']} has no model exported at {reference_variant['input_size']} px in {reference_variant['path']}")
+    _, reference_detections = run_model_variant(reference_variant, frames, num_threads)
+    reference_box_count = sum(len(boxes) for boxes in reference_detections)
+    if reference_box_count < OBJECT_DETECTION_MIN_REFERENCE_BOXES:
+        raise ValueError(
+            f"The reference variant detected {reference_box_count} boxes in the recording, fewer than the "
+            f"{OBJECT_DETECTION_MIN_REFERENCE_BOXES} needed to measure agreement; profile with a recording that has objects in view"
+        )
+
+    variants = OBJECT_DETECTION_MODEL_VARIANTS if variant_names is None else [get_model_variant(name) for name in variant_names]
+    profile = {"hardware": get_hardware_id(), "frames": len(frames), "variants": {}}
+
+    for variant in variants:
+        if not is_model_variant_available(variant):
+            print(f"Skipping {variant['name']}: no model exported at {variant['input_size']} px in {variant['path']}")
+            continue
+
+        try:
+            latencies, detections = run_model_variant(variant, frames, num_threads)
+        except Exception as e:
+            print(f"Skipping {variant['name']}: {type(e).__name__}: {e}")
+            continue
+
+        box_count = sum(len(boxes) for boxes in detections)
+        match_count = sum(count_matching_boxes(boxes, reference_boxes) for boxes, reference_boxes in zip(detections, reference_detections))
+        milliseconds = latencies * 1000
+
+        profile["variants"][variant["name"]] = {
+            "latency_p50_ms": float(np.percentile(milliseconds, 50)) if len(milliseconds) else 0.0,
+            "latency_p90_ms": float(np.percentile(milliseconds, 90)) if len(milliseconds) else 0.0,
+            "agreement": 2 * match_count / (box_count + reference_box_count)
+        }
+    return profile
+
+def format_profile(profile):
+    lines = [f"Hardware: {profile['hardware']}, {profile['frames']} frames", f"{'variant':<24}{'p50 ms':>10}{'p90 ms':>10}{'agreement':>12}"]
+    for name, results in profile["variants"].items():
+        lines.append(f"{name:<24}{results['latency_p50_ms']:>10.2f}{results['latency_p90_ms']:>10.2f}{results['agreement']:>12.1%}")
+
+    selected_name = select_profiled_variant(profile)
+    lines.append(
+        f"Auto selection (agreement >= {OBJECT_DETECTION_MIN_AGREEMENT:.0%}, p90 <= {OBJECT_DETECTION_LATENCY_BUDGET * 1000:.0f} ms): "
+        f"{selected_name or 'none, the reference variant is used'}"
+    )
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the latency and detection agreement of the object detection model variants")
+    parser.add_argument("recording", help="Video file, or directory of images and .npz frame files")
+    parser.add_argument("--variants", nargs="+", metavar="NAME", help="Variants to profile (defaults to all configured variants)")
+    parser.add_argument("--max-frames", type=int, default=100, help="Use only the first frames of the recording")
+    parser.add_argument("--output", default=OBJECT_DETECTION_PROFILE_PATH, help="Where to write the profile that auto selection reads")
+    args = parser.parse_args()
+
+    profile = profile_model_variants(load_frames(args.recording), args.variants, args.max_frames)
+    print(format_profile(profile))
+    save_variant_profile(profile, args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+import argparse
+import json
+import os
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from config import FRAME_WIDTH, FRAME_HEIGHT, LORES_FRAME_HEIGHT
+from camera_control import FakeCamera
+from motor_control import FakeMotor, set_motor_speeds
+from drive_assist import create_perception_stages, get_lane_offset_and_mio_distance, shutdown_perception_engine
+from control_loop import initialize_pid_controllers, compute_motor_speeds
+from cpu_plan import set_cpu_plan, get_role_cpu_settings, apply_cpu_settings
+from load_governor import perception_settings
+from stage_timer import stage_timer, summarize_stage_samples, format_stage_summary
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+
+# Per-frame allocation limits for the allocation check: transient allocations must stay well below one
+# full-size frame, and memory still held after the measured frames must not keep growing
+MAX_FRAME_ALLOCATION = FRAME_WIDTH * FRAME_HEIGHT # A quarter of a BGRA frame
+MAX_RETAINED_GROWTH = 64 * 1024
+
+# Accuracy limits for the lane scale check, against full-resolution lane detection: mean absolute lane offset
+# difference (offsets range from -63 to 63) over frames where both find lanes, and agreement on whether lanes are found
+MAX_LANE_SCALE_OFFSET_ERROR = 3.0
+MIN_LANE_SCALE_DETECTION_AGREEMENT = 0.95
+
+# Yields the frames of a recording: a video file, or a directory of images and .npz files (one frame or a stack of frames per array)
+def load_frames(path):
+    if not os.path.isdir(path):
+        capture = cv2.VideoCapture(path)
+        if not capture.isOpened():
+            raise FileNotFoundError(f"Cannot open recording {path}")
+        try:
+            while True:
+                is_read, frame = capture.read()
+                if not is_read:
+                    break
+                yield frame
+        finally:
+            capture.release()
+        return
+
+    for file_name in sorted(os.listdir(path)):
+        file_path = os.path.join(path, file_name)
+        extension = os.path.splitext(file_name)[1].lower()
+
+        if extension == ".npz":
+            with np.load(file_path) as arrays:
+                for array in arrays.values():
+                    yield from (array if array.ndim == 4 else [array])
+        elif extension in IMAGE_EXTENSIONS:
+            yield cv2.imread(file_path, cv2.IMREAD_UNCHANGED)
+
+# Drives a recording through the perception and control code with a fake camera and motors and returns a benchmark report
+def run_replay(frames, lores=False, max_frames=None, warmup_frames=5):
+    """
+    Frames are read synchronously, so every frame is processed (a live camera stream drops frames instead).
+    The first warmup_frames are excluded from the report since they include one-time costs such as model loading.
+    """
+
+    camera = FakeCamera(frames, loop=False)
+    stream_names = ["main", "lores"] if lores else ["main"]
+    motor_l, motor_r = FakeMotor(), FakeMotor()
+    pid_lane, pid_mio = initialize_pid_controllers()
+    stage_timer.enable(keep_samples=True)
+
+    frame_count = 0
+    lane_frame_count = 0
+    start_time = time.perf_counter()
+
+    try:
+        while max_frames is None or frame_count < max_frames + warmup_frames:
+            try:
+                arrays, _ = camera.capture_arrays(stream_names)
+            except EOFError:
+                break
+
+            if frame_count == warmup_frames:
+                stage_timer.drain()
+                lane_frame_count = 0
+                start_time = time.perf_counter()
+
+            frame_start_time = time.perf_counter()
+            lores_luma = arrays[1][:LORES_FRAME_HEIGHT] if lores else None
+            lane_offset, mio_distance = get_lane_offset_and_mio_distance(arrays[0], lores_luma)
+
+            if lane_offset is not None:
+                motor_l_speed, motor_r_speed = compute_motor_speeds(pid_lane, pid_mio, lane_offset, mio_distance)
+                set_motor_speeds(motor_l, motor_l_speed, motor_r, motor_r_speed)
+                lane_frame_count += 1
+
+            stage_timer.record("end_to_end", time.perf_counter() - frame_start_time)
+            frame_count += 1
+    finally:
+        elapsed_time = time.perf_counter() - start_time
+        shutdown_perception_engine()
+        stage_timer.enable(False)
+
+    measured_frame_count = max(frame_count - warmup_frames, 0)
+    return {
+        "frames": measured_frame_count,
+        "lane_detection_rate": lane_frame_count / measured_frame_count if measured_frame_count else 0.0,
+        "fps": measured_frame_count / elapsed_time if measured_frame_count else 0.0,
+        "stages": summarize_stage_samples(stage_timer.drain())
+    }
+
+# Runs the lane and object detection stages in this process and measures the memory each frame allocates
+def check_allocations(frames, lores=False, max_frames=None, warmup_frames=5):
+    """
+    Python and NumPy allocations are traced with tracemalloc. Returns the largest peak allocation of a single
+    frame and the growth of retained memory over the measured frames, in bytes, and whether both are within limits.
+    """
+
+    camera = FakeCamera(frames, loop=False)
+    stream_names = ["main", "lores"] if lores else ["main"]
+    lane_stage, object_stage = create_perception_stages()
+    frame_allocations = []
+    retained_growth = 0
+    frame_count = 0
+
+    try:
+        while max_frames is None or frame_count < max_frames + warmup_frames:
+            try:
+                arrays, _ = camera.capture_arrays(stream_names)
+            except EOFError:
+                break
+
+            if frame_count == warmup_frames:
+                tracemalloc.start()
+
+            # Only the stages are measured, not the frame source
+            if frame_count >= warmup_frames:
+                tracemalloc.reset_peak()
+                frame_start_memory = tracemalloc.get_traced_memory()[0]
+
+            lane_stage(arrays[1][:LORES_FRAME_HEIGHT] if lores else arrays[0])
+            object_stage(arrays[0])
+
+            if frame_count >= warmup_frames:
+                frame_end_memory, frame_peak_memory = tracemalloc.get_traced_memory()
+                frame_allocations.append(frame_peak_memory - frame_start_memory)
+                retained_growth += frame_end_memory - frame_start_memory
+            frame_count += 1
+    finally:
+        tracemalloc.stop()
+
+    max_frame_allocation = max(frame_allocations, default=0)
+    return {
+        "frames": len(frame_allocations),
+        "max_frame_allocation": max_frame_allocation,
+        "retained_growth": retained_growth,
+        "is_within_limits": max_frame_allocation <= MAX_FRAME_ALLOCATION and retained_growth <= MAX_RETAINED_GROWTH
+    }
+
+# Runs lane detection on every frame at full resolution and at a reduced scale, and compares the lane offsets
+def check_lane_scale(frames, scale, lores=False, max_frames=None):
+    """
+    Each scale has its own lane stage (so lane trackers keep separate state), and both see the same frames.
+    Returns the offset differences, how often both scales agree on whether lanes are found, the speedup of the
+    reduced scale, and whether the accuracy is within limits.
+    """
+
+    camera = FakeCamera(frames, loop=False)
+    stream_names = ["main", "lores"] if lores else ["main"]
+    lane_stages = {1.0: create_perception_stages()[0], scale: create_perception_stages()[0]}
+    durations = dict.fromkeys(lane_stages, 0.0)
+    offset_errors = []
+    agreement_count = 0
+    frame_count = 0
+    default_scale = perception_settings.lane_scale
+
+    try:
+        while max_frames is None or frame_count < max_frames:
+            try:
+                arrays, _ = camera.capture_arrays(stream_names)
+            except EOFError:
+                break
+
+            lane_offsets = {}
+            for lane_scale, lane_stage in lane_stages.items():
+                perception_settings.lane_scale = lane_scale
+                start_time = time.perf_counter()
+                _, lane_offsets[lane_scale] = lane_stage(arrays[1][:LORES_FRAME_HEIGHT] if lores else arrays[0])
+                durations[lane_scale] += time.perf_counter() - start_time
+
+            full_offset, scaled_offset = lane_offsets[1.0], lane_offsets[scale]
+            if (full_offset is None) == (scaled_offset is None):
+                agreement_count += 1
+            if full_offset is not None and scaled_offset is not None:
+                offset_errors.append(abs(full_offset - scaled_offset))
+            frame_count += 1
+    finally:
+        perception_settings.lane_scale = default_scale
+
+    mean_offset_error = float(np.mean(offset_errors)) if offset_errors else 0.0
+    detection_agreement = agreement_count / frame_count if frame_count else 1.0
+    return {
+        "frames": frame_count,
+        "scale": scale,
+        "mean_offset_error": mean_offset_error,
+        "max_offset_error": max(offset_errors, default=0),
+        "detection_agreement": detection_agreement,
+        "speedup": durations[1.0] / durations[scale] if durations[scale] else 0.0,
+        "is_within_limits": mean_offset_error <= MAX_LANE_SCALE_OFFSET_ERROR and detection_agreement >= MIN_LANE_SCALE_DETECTION_AGREEMENT
+    }
+
+def format_report(report):
+    return "\n".join([
+        f"Frames: {report['frames']}",
+        f"Lane detection rate: {report['lane_detection_rate']:.1%}",
+        f"End-to-end FPS: {report['fps']:.1f}",
+        "Stage latencies (ms):",
+        format_stage_summary(report["stages"])
+    ])
+
+# Compares the replay reports of several CPU plans by end-to-end and per-stage tail latency
+def format_cpu_plan_comparison(reports, stages=("end_to_end", "yolo", "warp", "mask")):
+    lines = [f"{'plan':<16}{'fps':>8}" + "".join(f"{stage + ' p99':>16}" for stage in stages) + f"{'end_to_end max':>16}"]
+    for plan_name, report in reports.items():
+        stage_summary = report["stages"]
+        p99s = "".join(f"{stage_summary[stage]['p99']:>16.2f}" if stage in stage_summary else f"{'-':>16}" for stage in stages)
+        max_latency = stage_summary["end_to_end"]["max"] if "end_to_end" in stage_summary else 0.0
+        lines.append(f"{plan_name:<16}{report['fps']:>8.1f}{p99s}{max_latency:>16.2f}")
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded frames through the drive assist pipeline and report stage latencies")
+    parser.add_argument("recording", help="Video file, or directory of images and .npz frame files")
+    parser.add_argument("--lores", action="store_true", help="Run lane detection on the luma plane of a synthesized lores stream")
+    parser.add_argument("--max-frames", type=int, help="Stop after this many measured frames")
+    parser.add_argument("--warmup-frames", type=int, default=5, help="Frames processed before measuring")
+    parser.add_argument("--json", help="Also write the report to this JSON file")
+    parser.add_argument("--check-allocations", action="store_true", help="Check that steady-state frames allocate no full-size buffers instead")
+    parser.add_argument("--check-lane-scale", type=float, metavar="SCALE", help="Check lane detection at this scale against full resolution instead")
+    parser.add_argument("--cpu-plan", action="append", metavar="PLAN", help="CPU plan from config.CPU_PLANS to replay with; repeat to compare plans")
+    args = parser.parse_args()
+
+    if args.check_lane_scale is not None:
+        report = check_lane_scale(load_frames(args.recording), args.check_lane_scale, args.lores, args.max_frames)
+        print(
+            f"Frames: {report['frames']}, lane scale {report['scale']:g}: lane offset error mean {report['mean_offset_error']:.2f} "
+            f"(limit {MAX_LANE_SCALE_OFFSET_ERROR}), max {report['max_offset_error']}, detection agreement "
+            f"{report['detection_agreement']:.1%} (limit {MIN_LANE_SCALE_DETECTION_AGREEMENT:.0%}), speedup {report['speedup']:.2f}x"
+        )
+        if not report["is_within_limits"]:
+            raise SystemExit("Lane scale check failed")
+    elif args.check_allocations:
+        report = check_allocations(load_frames(args.recording), args.lores, args.max_frames, args.warmup_frames)
+        print(
+            f"Frames: {report['frames']}, largest frame allocation: {report['max_frame_allocation']} bytes "
+            f"(limit {MAX_FRAME_ALLOCATION}), retained growth: {report['retained_growth']} bytes (limit {MAX_RETAINED_GROWTH})"
+        )
+        if not report["is_within_limits"]:
+            raise SystemExit("Allocation check failed")
+    else:
+        reports = {}
+        for cpu_plan_name in args.cpu_plan or [None]:
+            if cpu_plan_name is not None:
+                set_cpu_plan(cpu_plan_name)
+            # The perception workers of each replay are started with the plan in effect
+            apply_cpu_settings(get_role_cpu_settings("main"))
+            reports[cpu_plan_name] = run_replay(load_frames(args.recording), args.lores, args.max_frames, args.warmup_frames)
+
+        if len(reports) == 1:
+            report = next(iter(reports.values()))
+            print(format_report(report))
+        else:
+            report = reports
+            print(format_cpu_plan_comparison(reports))
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2)
+
+if __name__ == "__main__":
+    main()
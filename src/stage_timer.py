@@ -0,0 +1,86 @@
+import contextlib
+import time
+
+import numpy as np
+
+# Order in which the pipeline stages are reported; stages not listed here are reported after them
+PIPELINE_STAGES = ["warp", "mask", "erode", "components", "sliding_window", "lane_tracking", "polyfit", "yolo", "find_mio", "end_to_end"]
+
+# Times a block of code and records its duration under a stage name
+class StageTiming:
+    def __init__(self, timer, stage):
+        self.timer = timer
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *_):
+        self.timer.record(self.stage, time.perf_counter() - self.start)
+
+# Collects per-stage latencies when enabled; disabled timers cost one attribute check per stage
+class StageTimer:
+    """
+    The time spent in each stage is summed per frame in frame_durations until reset_frame is called.
+    With keep_samples, every duration is also kept in samples for computing percentiles later.
+    """
+
+    def __init__(self):
+        self.is_enabled = False
+        self.keep_samples = False
+        self.frame_durations = {}
+        self.samples = {}
+
+    def enable(self, is_enabled=True, keep_samples=False):
+        self.is_enabled = is_enabled
+        self.keep_samples = keep_samples
+
+    def time(self, stage):
+        return StageTiming(self, stage) if self.is_enabled else contextlib.nullcontext()
+
+    def record(self, stage, seconds):
+        self.frame_durations[stage] = self.frame_durations.get(stage, 0.0) + seconds
+        if self.keep_samples:
+            self.samples.setdefault(stage, []).append(seconds)
+
+    # Adds samples collected elsewhere (e.g. in a perception worker process)
+    def merge(self, samples):
+        for stage, stage_samples in samples.items():
+            for seconds in stage_samples:
+                self.record(stage, seconds)
+
+    def reset_frame(self):
+        self.frame_durations.clear()
+
+    # Returns the collected samples and starts over
+    def drain(self):
+        samples, self.samples = self.samples, {}
+        self.reset_frame()
+        return samples
+
+stage_timer = StageTimer()
+
+# Summarizes latency samples per stage as count, mean and percentiles in milliseconds
+def summarize_stage_samples(samples, percentiles=(50, 90, 99)):
+    stages = [stage for stage in PIPELINE_STAGES if stage in samples] + sorted(set(samples) - set(PIPELINE_STAGES))
+    summary = {}
+
+    for stage in stages:
+        milliseconds = np.asarray(samples[stage]) * 1000
+        summary[stage] = {
+            "count": len(milliseconds),
+            "mean": float(milliseconds.mean()),
+            **{f"p{percentile}": float(value) for percentile, value in zip(percentiles, np.percentile(milliseconds, percentiles))},
+            "max": float(milliseconds.max())
+        }
+    return summary
+
+def format_stage_summary(summary):
+    if not summary:
+        return "No stage timings recorded"
+
+    columns = list(next(iter(summary.values())))
+    lines = [f"{'stage':<16}" + "".join(f"{column:>10}" for column in columns)]
+    for stage, stats in summary.items():
+        lines.append(f"{stage:<16}" + "".join(f"{stats[column]:>10}" if column == "count" else f"{stats[column]:>10.2f}" for column in columns))
+    return "\n".join(lines)
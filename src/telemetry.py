@@ -0,0 +1,77 @@
+import atexit
+import signal
+
+import numpy as np
+
+from stage_timer import PIPELINE_STAGES
+
+# One record per processed frame. Values that were not produced for a frame (e.g. stages that did not run) are NaN.
+TELEMETRY_DTYPE = np.dtype([
+    ("frame_id", np.int64),
+    ("capture_time", np.float64), # time.perf_counter() seconds
+    ("dropped_frames", np.int32), # Camera frames skipped since the previous record
+    ("is_skipped", np.bool_), # No lanes detected, so the motors were not updated
+    ("degradation_level", np.int8), # Load governor level the frame was processed at
+    ("lane_offset", np.float32),
+    ("mio_distance", np.float32),
+    ("pid_lane_p", np.float32),
+    ("pid_lane_i", np.float32),
+    ("pid_lane_d", np.float32),
+    ("pid_mio_p", np.float32),
+    ("pid_mio_i", np.float32),
+    ("pid_mio_d", np.float32),
+    ("motor_l_pwm", np.float32),
+    ("motor_r_pwm", np.float32)
+] + [(f"{stage}_ms", np.float32) for stage in PIPELINE_STAGES])
+
+STAGE_FIELDS = [(stage, f"{stage}_ms") for stage in PIPELINE_STAGES]
+
+# Fixed-size ring of per-frame telemetry records, overwriting the oldest once full
+class TelemetryRing:
+    """
+    The records are preallocated in a structured NumPy array and written in place, so recording a frame
+    allocates no arrays. The ring can be dumped to a .npy file at any time (e.g. on SIGUSR1) and at exit.
+    Load a dump with np.load(path) to get the records in chronological order.
+    """
+
+    def __init__(self, capacity):
+        self.records = np.zeros(capacity, dtype=TELEMETRY_DTYPE)
+        self.record_count = 0
+
+    def record_frame(self, frame_id, capture_time, dropped_frames, degradation_level, lane_offset, mio_distance, pid_lane, pid_mio, motor_pwms, stage_durations):
+        record = self.records[self.record_count % len(self.records)]
+        is_skipped = motor_pwms is None
+
+        record["frame_id"] = frame_id
+        record["capture_time"] = capture_time
+        record["dropped_frames"] = dropped_frames
+        record["is_skipped"] = is_skipped
+        record["degradation_level"] = degradation_level
+        record["lane_offset"] = np.nan if lane_offset is None else lane_offset
+        record["mio_distance"] = np.nan if mio_distance is None else mio_distance
+        record["pid_lane_p"], record["pid_lane_i"], record["pid_lane_d"] = (np.nan,) * 3 if is_skipped else pid_lane.terms
+        record["pid_mio_p"], record["pid_mio_i"], record["pid_mio_d"] = (np.nan,) * 3 if is_skipped else pid_mio.terms
+        record["motor_l_pwm"], record["motor_r_pwm"] = (np.nan,) * 2 if is_skipped else motor_pwms
+
+        for stage, field in STAGE_FIELDS:
+            record[field] = stage_durations[stage] * 1000 if stage in stage_durations else np.nan
+
+        self.record_count += 1
+
+    # Returns a copy of the stored records, oldest first
+    def snapshot(self):
+        capacity = len(self.records)
+        if self.record_count <= capacity:
+            return self.records[:self.record_count].copy()
+
+        start = self.record_count % capacity
+        return np.concatenate((self.records[start:], self.records[:start]))
+
+    def dump(self, path):
+        np.save(path, self.snapshot())
+
+    # Dumps the ring when the process exits and whenever it receives SIGUSR1
+    def enable_dumps(self, path):
+        atexit.register(self.dump, path)
+        if hasattr(signal, "SIGUSR1"):
+            signal.signal(signal.SIGUSR1, lambda *_: self.dump(path))
@@ -1,4 +1,5 @@
 import cv2
+import numpy as np
 
 from config import (
     FRAME_WIDTH,
@@ -18,18 +19,231 @@ def clamp_value(value, min_value, max_value):
 def map_value(x, a, b, c, d):
     return (x - a) * (d - c) / (b - a) + c
 
+# Named arrays that are allocated once and reused on every frame
+class BufferPool:
+    def __init__(self):
+        self.buffers = {}
+
+    # Returns the buffer with the given name, (re)allocating it only if its shape or type changed
+    def get(self, name, shape, dtype=np.uint8):
+        buffer = self.buffers.get(name)
+        if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+            buffer = np.empty(shape, dtype=dtype)
+            self.buffers[name] = buffer
+        return buffer
+
+    # Allocates buffers up front, given as (name, shape) or (name, shape, dtype) entries
+    def reserve(self, buffer_specs):
+        for buffer_spec in buffer_specs:
+            self.get(*buffer_spec)
+
+# Buffers are per process, so each perception worker has its own
+buffer_pool = BufferPool()
+
+# Resizes an image into a pooled buffer, or returns it as is if it already has the given size
+def resize_frame(image, size, buffer_name):
+    width, height = size
+    if image.shape[:2] == (height, width):
+        return image
+    return cv2.resize(image, size, dst=buffer_pool.get(buffer_name, (height, width) + image.shape[2:]))
+
 # Masks an image based on an HSV color range
-def color_mask(image, lower_bound, upper_bound):
+def color_mask(image, lower_bound, upper_bound, dst=None):
     hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
-    mask = cv2.inRange(hsv, lower_bound, upper_bound)
+    mask = cv2.inRange(hsv, lower_bound, upper_bound, dst=dst)
+    return mask
+
+# Merges duplicate and overlapping HSV color ranges into an equivalent, smaller list of ranges
+def merge_color_ranges(color_ranges):
+    merged_ranges = [(np.asarray(lower_bound), np.asarray(upper_bound)) for lower_bound, upper_bound in color_ranges]
+
+    is_merged = True
+    while is_merged:
+        is_merged = False
+        for i in range(len(merged_ranges)):
+            for j in range(i + 1, len(merged_ranges)):
+                (lower_i, upper_i), (lower_j, upper_j) = merged_ranges[i], merged_ranges[j]
+                lower_union, upper_union = np.minimum(lower_i, lower_j), np.maximum(upper_i, upper_j)
+
+                # Two ranges can be replaced by their union only if it adds no colors that neither range covers:
+                # one range contains the other, or they differ in a single channel where they touch or overlap
+                is_contained = (np.all(lower_i <= lower_j) and np.all(upper_j <= upper_i)) or \
+                    (np.all(lower_j <= lower_i) and np.all(upper_i <= upper_j))
+                differing_channels = (lower_i != lower_j) | (upper_i != upper_j)
+                is_adjacent = np.count_nonzero(differing_channels) == 1 and \
+                    np.all(np.maximum(lower_i, lower_j) <= np.minimum(upper_i, upper_j) + 1)
+
+                if is_contained or is_adjacent:
+                    merged_ranges[i] = (lower_union, upper_union)
+                    del merged_ranges[j]
+                    is_merged = True
+                    break
+            if is_merged:
+                break
+
+    return merged_ranges
+
+# Masks an image based on several ranges, OR-ing the per-range masks into one
+def multi_range_mask(image, ranges, dst=None, range_mask_dst=None):
+    mask = cv2.inRange(image, ranges[0][0], ranges[0][1], dst=dst)
+
+    for lower_bound, upper_bound in ranges[1:]:
+        range_mask_dst = cv2.inRange(image, lower_bound, upper_bound, dst=range_mask_dst)
+        cv2.bitwise_or(mask, range_mask_dst, dst=mask)
+
     return mask
 
+# Masks an image based on several HSV color ranges, converting it to HSV only once
+def multi_color_mask(image, color_ranges, dst=None, hsv_dst=None, range_mask_dst=None):
+    hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV, dst=hsv_dst)
+    return multi_range_mask(hsv, color_ranges, dst, range_mask_dst)
+
+# Clips line segments to the rectangle [0, width] x [0, height] (Liang-Barsky), returning the clipped
+# endpoints and a mask of the segments that are at least partly visible
+def clip_segments(start, end, width, height):
+    delta = end - start
+    p = np.stack([-delta[:, 0], delta[:, 0], -delta[:, 1], delta[:, 1]], axis=1)
+    q = np.stack([start[:, 0], width - start[:, 0], start[:, 1], height - start[:, 1]], axis=1)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = q / p
+    t_enter = np.max(np.where(p < 0, t, 0), axis=1)
+    t_exit = np.min(np.where(p > 0, t, 1), axis=1)
+    is_visible = (t_enter <= t_exit) & ~np.any((p == 0) & (q < 0), axis=1)
+
+    clipped_start = start + t_enter[:, None] * delta
+    clipped_end = start + t_exit[:, None] * delta
+    return clipped_start, clipped_end, is_visible
+
+# Warps images between two perspectives using a cached homography and precomputed fixed-point remap tables
+class PerspectiveWarper:
+    def __init__(self, src_points, dst_points, size, border_value=0):
+        self.size = size
+        self.border_value = border_value
+        self.src_points = None
+        self.dst_points = None
+        self.set_points(src_points, dst_points)
+
+    # Updates the calibration points, discarding the cached tables only if the points changed
+    def set_points(self, src_points, dst_points):
+        src_points = np.float32(src_points)
+        dst_points = np.float32(dst_points)
+        if np.array_equal(src_points, self.src_points) and np.array_equal(dst_points, self.dst_points):
+            return False
+
+        self.src_points = src_points
+        self.dst_points = dst_points
+        self.matrix = cv2.getPerspectiveTransform(src_points, dst_points)
+        self.linear_maps = None
+        self.nearest_map = None
+        self.coverage_mask = None
+        return True
+
+    # Computes the source location of every destination pixel, the same inverse mapping cv2.warpPerspective uses
+    def compute_maps(self):
+        width, height = self.size
+        inverse = np.linalg.inv(self.matrix)
+        x, y = np.meshgrid(np.arange(width, dtype=np.float64), np.arange(height, dtype=np.float64))
+
+        w = inverse[2, 0] * x + inverse[2, 1] * y + inverse[2, 2]
+        w = np.divide(1.0, w, out=np.zeros_like(w), where=w != 0)
+        map_x = ((inverse[0, 0] * x + inverse[0, 1] * y + inverse[0, 2]) * w).astype(np.float32)
+        map_y = ((inverse[1, 0] * x + inverse[1, 1] * y + inverse[1, 2]) * w).astype(np.float32)
+        return map_x, map_y
+
+    # Bilinear fixed-point tables (integer coordinates plus interpolation table indices)
+    def get_linear_maps(self):
+        if self.linear_maps is None:
+            self.linear_maps = cv2.convertMaps(*self.compute_maps(), cv2.CV_16SC2)
+        return self.linear_maps
+
+    # Nearest-neighbour fixed-point table, used for single-channel masks
+    def get_nearest_map(self):
+        if self.nearest_map is None:
+            self.nearest_map, _ = cv2.convertMaps(*self.compute_maps(), cv2.CV_16SC2, nninterpolation=True)
+        return self.nearest_map
+
+    # Mask of the destination pixels that map inside the source frame (the rest are filled with the border value)
+    def get_coverage_mask(self, src_size):
+        if self.coverage_mask is None or self.coverage_mask_src_size != src_size:
+            src_width, src_height = src_size
+            self.coverage_mask = self.warp_mask(np.full((src_height, src_width), 255, dtype=np.uint8))
+            self.coverage_mask_src_size = src_size
+        return self.coverage_mask
+
+    # Transforms (N, 2) points, also returning which of them are on the same side of the horizon as the
+    # calibration points (the others have no meaningful projection)
+    def transform_points(self, points):
+        points = np.asarray(points, dtype=np.float32).reshape(-1, 2)
+        w = points @ self.matrix[2, :2] + self.matrix[2, 2]
+        reference_w = self.src_points[0] @ self.matrix[2, :2] + self.matrix[2, 2]
+        transformed_points = cv2.perspectiveTransform(points.reshape(-1, 1, 2), self.matrix).reshape(-1, 2)
+        return transformed_points, w * reference_w > 0
+
+    # Warps an image with bilinear interpolation, writing into dst if given
+    def warp(self, frame, border_value=None, dst=None):
+        map_xy, map_interpolation = self.get_linear_maps()
+        border_value = self.border_value if border_value is None else border_value
+        return cv2.remap(frame, map_xy, map_interpolation, cv2.INTER_LINEAR, dst=dst,
+                         borderMode=cv2.BORDER_CONSTANT, borderValue=border_value)
+
+    # Warps a single-channel mask with nearest-neighbour lookups, which keeps it binary and skips interpolation
+    def warp_mask(self, mask, border_value=0, dst=None):
+        return cv2.remap(mask, self.get_nearest_map(), None, cv2.INTER_NEAREST, dst=dst,
+                         borderMode=cv2.BORDER_CONSTANT, borderValue=border_value)
+
+perspective_warper = PerspectiveWarper(
+    ORIGINAL_PERSPECTIVE_POINTS, WARPED_PERSPECTIVE_POINTS, (WARPED_FRAME_WIDTH, WARPED_FRAME_HEIGHT),
+    WARP_PERSPECTIVE_BG_COLOR
+)
+perspective_unwarper = PerspectiveWarper(
+    WARPED_PERSPECTIVE_POINTS, ORIGINAL_PERSPECTIVE_POINTS, (FRAME_WIDTH, FRAME_HEIGHT)
+)
+
+scaled_perspective_warpers = {}
+
+# Returns the warper from frames of a source size to a bird's-eye view scaled by a factor, kept in sync with the
+# perspective calibration unless other original perspective points are given (e.g. by a parameter sweep). Smaller
+# sources (e.g. the camera's lores stream) are warped directly instead of being upscaled first.
+def get_scaled_perspective_warper(scale, source_size=(FRAME_WIDTH, FRAME_HEIGHT), src_points=None):
+    source_size = tuple(source_size)
+    if src_points is None and scale == 1 and source_size == (FRAME_WIDTH, FRAME_HEIGHT):
+        return perspective_warper
+
+    # Pixel centers line up between a frame and its resized copy, as with cv2.resize
+    source_scale = np.float32(source_size) / (FRAME_WIDTH, FRAME_HEIGHT)
+    src_points = perspective_warper.src_points if src_points is None else np.float32(src_points)
+    scaled_src_points = (src_points + 0.5) * source_scale - 0.5
+    scaled_dst_points = perspective_warper.dst_points * scale
+    key = (scale, source_size) if src_points is perspective_warper.src_points else (scale, source_size, src_points.tobytes())
+    if key not in scaled_perspective_warpers:
+        size = (round(WARPED_FRAME_WIDTH * scale), round(WARPED_FRAME_HEIGHT * scale))
+        scaled_perspective_warpers[key] = PerspectiveWarper(scaled_src_points, scaled_dst_points, size, WARP_PERSPECTIVE_BG_COLOR)
+    else:
+        scaled_perspective_warpers[key].set_points(scaled_src_points, scaled_dst_points)
+    return scaled_perspective_warpers[key]
+
+# Updates the perspective calibration; remap tables are rebuilt on the next warp only if the points changed
+def set_perspective_points(original_points, warped_points):
+    perspective_warper.set_points(original_points, warped_points)
+    perspective_unwarper.set_points(warped_points, original_points)
+
+# Transforms points from the original to the warped perspective
+def warp_points(points):
+    return perspective_warper.transform_points(points)
+
+# Transforms points from the warped to the original perspective
+def unwarp_points(points):
+    return perspective_unwarper.transform_points(points)
+
 # Warps an image and fills empty spaces with a color based on config-defined parameters
-def warp_perspective(frame, bg_color=WARP_PERSPECTIVE_BG_COLOR):
-    matrix = cv2.getPerspectiveTransform(ORIGINAL_PERSPECTIVE_POINTS, WARPED_PERSPECTIVE_POINTS) 
-    return cv2.warpPerspective(frame, matrix, (WARPED_FRAME_WIDTH, WARPED_FRAME_HEIGHT), borderValue=bg_color)
+def warp_perspective(frame, bg_color=WARP_PERSPECTIVE_BG_COLOR, dst=None):
+    return perspective_warper.warp(frame, bg_color, dst)
+
+# Warps a single-channel mask to the bird's-eye view using the nearest-neighbour fast path
+def warp_mask_perspective(mask, bg_value=0, dst=None):
+    return perspective_warper.warp_mask(mask, bg_value, dst)
 
 # Reverts a warped image to its original perspective based on config-defined parameters
-def unwarp_perspective(frame):
-    matrix = cv2.getPerspectiveTransform(WARPED_PERSPECTIVE_POINTS, ORIGINAL_PERSPECTIVE_POINTS) 
-    return cv2.warpPerspective(frame, matrix, (FRAME_WIDTH, FRAME_HEIGHT))
\ No newline at end of file
+def unwarp_perspective(frame, dst=None):
+    return perspective_unwarper.warp(frame, dst=dst)
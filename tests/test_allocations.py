@@ -0,0 +1,49 @@
+import cv2
+import numpy as np
+import pytest
+
+import object_detection
+from config import (
+    FRAME_WIDTH,
+    FRAME_HEIGHT,
+    WARPED_FRAME_WIDTH,
+    WARPED_FRAME_HEIGHT,
+    WARPED_LANE_WIDTH,
+    ORIGINAL_PERSPECTIVE_POINTS,
+    WARPED_PERSPECTIVE_POINTS
+)
+from replay import MAX_FRAME_ALLOCATION, MAX_RETAINED_GROWTH, check_allocations
+
+# Stands in for the detection model, which the allocation limits do not cover, and returns a fixed in-lane box
+class FixedBoxDetector:
+    def __call__(self, image):
+        return [[300, 200, 360, 300]]
+
+# Renders a camera frame of the two-lane track, drawn in the bird's-eye view and warped to the camera's perspective
+def make_frame(shift, seed):
+    warped_frame = np.full((WARPED_FRAME_HEIGHT, WARPED_FRAME_WIDTH, 3), 60, dtype=np.uint8)
+    ys = np.arange(0, WARPED_FRAME_HEIGHT, 2)
+    c_line_xs = WARPED_FRAME_WIDTH / 2 + shift + 30 * ((WARPED_FRAME_HEIGHT - ys) / WARPED_FRAME_HEIGHT) ** 2
+    for offset in (-WARPED_LANE_WIDTH, 0, WARPED_LANE_WIDTH):
+        points = np.int32(np.stack([c_line_xs + offset, ys], axis=1))
+        cv2.polylines(warped_frame, [points], False, (255, 255, 255), 12)
+
+    matrix = cv2.getPerspectiveTransform(WARPED_PERSPECTIVE_POINTS, ORIGINAL_PERSPECTIVE_POINTS)
+    frame = cv2.warpPerspective(warped_frame, matrix, (FRAME_WIDTH, FRAME_HEIGHT), borderValue=(90, 120, 90))
+    noise = np.random.default_rng(seed).integers(0, 10, frame.shape, dtype=np.uint8)
+    return cv2.add(frame, noise)
+
+@pytest.fixture
+def frames(monkeypatch):
+    variant = {"name": "fixed", "input_size": 640, "roi": None}
+    monkeypatch.setattr(object_detection, "object_detection_models", {"fixed": FixedBoxDetector()})
+    monkeypatch.setattr(object_detection, "level_variants", {None: variant})
+    return [make_frame(shift=(index % 20) - 10, seed=index) for index in range(30)]
+
+@pytest.mark.parametrize("lores", [False, True])
+def test_steady_state_frames_allocate_little(frames, lores):
+    report = check_allocations(frames, lores=lores, warmup_frames=5)
+
+    assert report["frames"] == 25
+    assert report["max_frame_allocation"] <= MAX_FRAME_ALLOCATION
+    assert report["retained_growth"] <= MAX_RETAINED_GROWTH
@@ -0,0 +1,101 @@
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("ncnn")
+
+from config import OBJECT_DETECTION_MODEL_PATH
+from ncnn_backend import LETTERBOX_COLOR, NcnnDetector, non_max_suppression
+
+# A detector on a network that only has its input layer, which is enough to check preprocessing without weights
+@pytest.fixture
+def input_only_detector(tmp_path):
+    (tmp_path / "model.ncnn.param").write_text("7767517\n1 1\nInput in0 0 1 in0\n")
+    (tmp_path / "model.ncnn.bin").write_bytes(b"")
+    return NcnnDetector(str(tmp_path), input_size=64)
+
+def test_preprocess_letterboxes_without_resizing(input_only_detector):
+    image = np.random.default_rng(0).integers(0, 256, (48, 64, 4), dtype=np.uint8) # BGRA
+    scale, pad_x, pad_y = input_only_detector.preprocess(image)
+
+    assert (scale, pad_x, pad_y) == (1.0, 0, 8)
+    letterbox_frame = input_only_detector.letterbox_frame
+    assert np.all(letterbox_frame[:8] == LETTERBOX_COLOR) and np.all(letterbox_frame[56:] == LETTERBOX_COLOR)
+    assert np.array_equal(letterbox_frame[8:56], image[:, :, :3])
+
+    # RGB channels first, scaled to [0, 1]
+    expected_input = letterbox_frame[:, :, ::-1].transpose(2, 0, 1) / 255
+    assert np.allclose(input_only_detector.input_array, expected_input)
+
+def test_preprocess_resizes_into_letterbox(input_only_detector):
+    image = np.full((24, 32, 3), 200, dtype=np.uint8)
+    scale, pad_x, pad_y = input_only_detector.preprocess(image)
+
+    assert (scale, pad_x, pad_y) == (2.0, 0, 8)
+    assert np.all(input_only_detector.letterbox_frame[8:56] == 200)
+    assert np.all(input_only_detector.letterbox_frame[:8] == LETTERBOX_COLOR)
+
+def test_load_fails_without_weights(tmp_path):
+    (tmp_path / "model.ncnn.param").write_text("7767517\n1 1\nInput in0 0 1 in0\n")
+    with pytest.raises(RuntimeError, match="model.ncnn.bin"):
+        NcnnDetector(str(tmp_path), input_size=64)
+
+# Decodes a synthetic output of the 640 px model for a 640x480 image, letterboxed into the middle of the input
+def test_postprocess_decodes_and_suppresses():
+    output = np.zeros((4 + 80, 8400), dtype=np.float32)
+    pad_y = 80
+    anchors = [
+        # center x, center y (in the letterboxed input), width, height, class id, confidence
+        (320, 240 + pad_y, 100, 50, 2, 0.9), # Kept
+        (325, 242 + pad_y, 100, 50, 2, 0.8), # Suppressed by the first box, same class
+        (325, 242 + pad_y, 100, 50, 0, 0.7), # Kept, as NMS runs per class
+        (620, 20 + pad_y, 60, 60, 7, 0.5), # Kept, clipped to the image
+        (380, 240 + pad_y, 100, 50, 2, 0.6), # Kept, overlaps the first box by less than the IoU threshold
+        (100, 100 + pad_y, 40, 40, 5, 0.2) # Below the confidence threshold
+    ]
+    for anchor, (center_x, center_y, width, height, class_id, confidence) in enumerate(anchors):
+        output[:4, anchor] = center_x, center_y, width, height
+        output[4 + class_id, anchor] = confidence
+
+    boxes = NcnnDetector.postprocess(output, 1.0, 0, pad_y, (480, 640, 3))
+    expected_boxes = np.array([(270, 215, 370, 265), (275, 217, 375, 267), (330, 215, 430, 265), (590, 0, 640, 50)])
+    assert np.allclose(boxes, expected_boxes)
+
+def test_postprocess_undoes_scaling():
+    output = np.zeros((4 + 80, 10), dtype=np.float32)
+    output[:5, 0] = 320, 320, 64, 32, 0.9
+
+    boxes = NcnnDetector.postprocess(output, 2.0, 0, 80, (240, 320, 3))
+    assert np.allclose(boxes, [(144, 112, 176, 128)])
+
+def test_postprocess_without_confident_anchors():
+    output = np.zeros((4 + 80, 10), dtype=np.float32)
+    assert NcnnDetector.postprocess(output, 1.0, 0, 0, (640, 640, 3)).shape == (0, 4)
+
+def test_non_max_suppression_keeps_best_boxes_up_to_limit():
+    boxes = np.array([(0, 0, 10, 10), (1, 1, 11, 11), (20, 20, 30, 30), (40, 40, 50, 50)], dtype=np.float32)
+    scores = np.array([0.5, 0.9, 0.3, 0.8])
+
+    assert non_max_suppression(boxes, scores, 0.5, 10).tolist() == [1, 3, 2]
+    assert non_max_suppression(boxes, scores, 0.5, 2).tolist() == [1, 3]
+    assert non_max_suppression(boxes, scores, 0.9, 10).tolist() == [1, 3, 0, 2]
+
+# Compares the ncnn backend with the ultralytics backend on the default exported model
+def test_matches_ultralytics():
+    if not os.path.exists(os.path.join(OBJECT_DETECTION_MODEL_PATH, "model.ncnn.bin")):
+        pytest.skip("The exported model weights are missing")
+    ultralytics = pytest.importorskip("ultralytics")
+    import cv2
+    from ultralytics.utils import ASSETS
+
+    ncnn_detector = NcnnDetector(OBJECT_DETECTION_MODEL_PATH)
+    ultralytics_model = ultralytics.YOLO(OBJECT_DETECTION_MODEL_PATH, task="detect")
+
+    for image_name in ("bus.jpg", "zidane.jpg"):
+        image = cv2.imread(str(ASSETS / image_name))
+        ncnn_boxes = np.array(ncnn_detector(image))
+        ultralytics_boxes = np.array([[int(value) for value in bbox.tolist()] for bbox in ultralytics_model(image, verbose=False)[0].boxes.xyxy])
+
+        assert len(ncnn_boxes) == len(ultralytics_boxes) > 0
+        assert np.abs(np.sort(ncnn_boxes, axis=0) - np.sort(ultralytics_boxes, axis=0)).max() <= 2
@@ -0,0 +1,110 @@
+import cv2
+import numpy as np
+import pytest
+
+from config import (
+    FRAME_WIDTH,
+    FRAME_HEIGHT,
+    WARPED_FRAME_WIDTH,
+    WARPED_FRAME_HEIGHT,
+    WARPED_LANE_WIDTH,
+    ORIGINAL_PERSPECTIVE_POINTS,
+    WARPED_PERSPECTIVE_POINTS
+)
+from lane_model import evaluate_fit
+from object_detection import compute_distance_to_object, compute_in_lane_distances, find_mio, get_warped_bottom_edges
+
+BOX_COUNT = 1500
+LINE_MARGIN = 20 # Same as compute_in_lane_distances
+FAR_EDGE_ROWS = 12 # One original row spans about this many warped rows at the far edge of the warped frame
+
+# Projects the bottom edge of a box to the bird's-eye view the way the distance computation used to, by drawing it
+# on a blank frame and warping that. Returns the bounding box of the warped edge (xmin, exclusive xmax and exclusive
+# ymax), or None if none of it is visible.
+def get_warped_bottom_edge_raster(xmin, xmax, ymax):
+    frame = np.zeros((FRAME_HEIGHT, FRAME_WIDTH), dtype=np.uint8)
+    cv2.line(frame, (xmin, ymax), (xmax, ymax), 255, 3)
+    matrix = cv2.getPerspectiveTransform(ORIGINAL_PERSPECTIVE_POINTS, WARPED_PERSPECTIVE_POINTS)
+    warped_frame = cv2.warpPerspective(frame, matrix, (WARPED_FRAME_WIDTH, WARPED_FRAME_HEIGHT), borderValue=0)
+    contours, _ = cv2.findContours(warped_frame, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if len(contours) == 0:
+        return None
+
+    warped_xmin, warped_ymin, width, height = cv2.boundingRect(contours[0])
+    return warped_xmin, warped_xmin + width, warped_ymin + height
+
+# Returns the analytic projection of a box's bottom edge in the same form as the raster one
+def get_warped_bottom_edge(xmin, xmax, ymax):
+    warped_xmin, warped_xmax, warped_ymax, is_object_visible = get_warped_bottom_edges([(xmin, 0, xmax, ymax)])
+    if not is_object_visible[0]:
+        return None
+    return int(warped_xmin[0]), int(warped_xmax[0]), int(warped_ymax[0])
+
+# Checks whether the in-lane decision on a warped edge hinges on sub-pixel sampling: an end of the edge lies within
+# a pixel of a lane boundary, or only a sliver of the edge shows at a side of the frame or in its far rows
+def is_tie(c_line_fit, warped_edge):
+    if warped_edge is None:
+        return False
+
+    warped_xmin, warped_xmax, warped_ymax = warped_edge
+    c_line_x = int(evaluate_fit(c_line_fit, np.array([warped_ymax]))[0]) + LINE_MARGIN
+    r_line_x = c_line_x + WARPED_LANE_WIDTH - LINE_MARGIN * 2
+    is_sliver = warped_xmax - warped_xmin <= 1 or warped_ymax <= FAR_EDGE_ROWS
+    return is_sliver or min(abs(x - line_x) for x in (warped_xmin, warped_xmax) for line_x in (c_line_x, r_line_x)) <= 1
+
+# Returns the distance to an object computed from its raster edge
+def compute_raster_distance(c_line_fit, warped_edge):
+    if warped_edge is None:
+        return WARPED_FRAME_HEIGHT
+    return int(compute_in_lane_distances(c_line_fit, *warped_edge))
+
+# Draws random center line fits and boxes, including boxes that reach past the frame edges
+def generate_cases(seed, box_count=BOX_COUNT):
+    rng = np.random.default_rng(seed)
+    for _ in range(box_count):
+        c_line_fit = np.array((rng.normal(0, 1e-4), rng.normal(0, 0.1), rng.uniform(100, 350)))
+        xmin = int(rng.integers(-50, FRAME_WIDTH))
+        xmax = int(rng.integers(xmin + 3, FRAME_WIDTH + 60))
+        ymax = int(rng.integers(150, FRAME_HEIGHT))
+        yield c_line_fit, xmin, xmax, ymax
+
+@pytest.mark.parametrize("seed", range(4))
+def test_distances_match_raster(seed):
+    differences = []
+    for c_line_fit, xmin, xmax, ymax in generate_cases(seed):
+        distance = compute_distance_to_object(c_line_fit, xmin, xmax, ymax)
+        reference_edge = get_warped_bottom_edge_raster(xmin, xmax, ymax)
+        reference_distance = compute_raster_distance(c_line_fit, reference_edge)
+
+        is_in_lane = distance < WARPED_FRAME_HEIGHT
+        is_reference_in_lane = reference_distance < WARPED_FRAME_HEIGHT
+        if is_in_lane != is_reference_in_lane:
+            assert is_tie(c_line_fit, reference_edge) or is_tie(c_line_fit, get_warped_bottom_edge(xmin, xmax, ymax)), (
+                f"In-lane decision differs for box ({xmin}, {xmax}, ymax {ymax}): {distance} instead of {reference_distance}"
+            )
+        elif is_in_lane:
+            differences.append(abs(distance - reference_distance))
+
+    assert len(differences) > 0
+    assert max(differences) <= 1
+
+def test_boxes_outside_frame_are_not_visible():
+    for xmin, xmax, ymax in [(-40, -4, 400), (644, 700, 400), (100, 200, 485)]:
+        assert get_warped_bottom_edge_raster(xmin, xmax, ymax) is None
+        assert get_warped_bottom_edge(xmin, xmax, ymax) is None
+
+def test_find_mio_matches_raster():
+    cases = list(generate_cases(seed=10, box_count=400))
+    for index in range(0, len(cases), 20):
+        c_line_fit = cases[index][0]
+        boxes, reference_distances = [], []
+        for _, xmin, xmax, ymax in cases[index:index + 20]:
+            reference_edge = get_warped_bottom_edge_raster(xmin, xmax, ymax)
+            if not is_tie(c_line_fit, reference_edge):
+                boxes.append((xmin, 0, xmax, ymax))
+                reference_distances.append(compute_raster_distance(c_line_fit, reference_edge))
+
+        mio, distance = find_mio(c_line_fit, boxes)
+        reference_distance = min(reference_distances)
+        assert abs(distance - reference_distance) <= 1
+        assert (mio is None) == (reference_distance >= WARPED_FRAME_HEIGHT)